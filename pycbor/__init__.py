@@ -1,300 +1,2217 @@
-import collections
 import struct
 import math
 import array
+import collections
+import dataclasses
+import datetime
+import decimal
+import fractions
+import functools
+import hashlib
+import ipaddress
+import itertools
+import operator
+import sys
+import threading
+import uuid
+
+try:
+    from collections.abc import ItemsView, Iterable, Mapping
+except ImportError:
+    from collections import ItemsView, Iterable, Mapping
 
 def _encode_int(data, major_type):
-    encoded = b''
-
-    if 0 <= data <= 23:
-        encoded += bytes([(major_type << 5) + data])
-    elif data < (2 << 7) - 1:
-        encoded += bytes([(major_type << 5) + 24])
-        encoded += struct.pack('>B', data)
-    elif data < (2 << 15) - 1:
-        encoded += bytes([(major_type << 5) + 25])
-        encoded += struct.pack('>H', data)
-    elif data < (2 << 31) - 1:
-        encoded += bytes([(major_type << 5) + 26])
-        encoded += struct.pack('>I', data)
-    elif data < (2 << 63) - 1:
-        encoded += bytes([(major_type << 5) + 27])
-        encoded += struct.pack('>Q', data)
-    else:
-        # TODO Handle values in this range
-        raise ValueError
+    major_type <<= 5
+
+    if data <= 23:
+        return bytes([major_type + data])
+    elif data <= 0xff:
+        return bytes([major_type + 24, data])
+    elif data <= 0xffff:
+        return struct.pack('>BH', major_type + 25, data)
+    elif data <= 0xffffffff:
+        return struct.pack('>BI', major_type + 26, data)
+    elif data <= 0xffffffffffffffff:
+        return struct.pack('>BQ', major_type + 27, data)
+
+    raise ValueError('%d does not fit in 64 bits' % data)
+
+
+_HALF = struct.Struct('>e')
+_SINGLE = struct.Struct('>f')
+_DOUBLE = struct.Struct('>d')
+
+# Every half-precision value indexed by its bits, built on first use
+_half_floats = None
+
+
+def _half_to_float(half):
+    global _half_floats
+    if _half_floats is None:
+        _half_floats = struct.unpack(
+            '=65536e', array.array('H', range(65536)).tobytes())
+
+    return _half_floats[half]
+
+
+def _encode_float(data):
+    if data != data:
+        # NaN
+        return b'\xf9\x7e\x00'
+
+    # Every half-precision value is also a single-precision value, so values
+    # which do not survive a round trip through single-precision can skip
+    # the half-precision check. Out of range values raise OverflowError.
+    try:
+        single = _SINGLE.pack(data)
+    except OverflowError:
+        return b'\xfb' + _DOUBLE.pack(data)
+    if _SINGLE.unpack(single)[0] != data:
+        # Double-precision
+        return b'\xfb' + _DOUBLE.pack(data)
+
+    try:
+        half = _HALF.pack(data)
+    except OverflowError:
+        return b'\xfa' + single
+    if _HALF.unpack(half)[0] == data:
+        # Half-precision, including zeros and infinities
+        return b'\xf9' + half
+
+    # Single-precision
+    return b'\xfa' + single
+
+
+def _encode_float_single(data):
+    # Finite values outside the single-precision range raise OverflowError
+    return b'\xfa' + _SINGLE.pack(data)
+
+
+def _encode_float_double(data):
+    return b'\xfb' + _DOUBLE.pack(data)
+
+
+_FLOAT_ENCODERS = {
+    'shortest': _encode_float,
+    'single': _encode_float_single,
+    'double': _encode_float_double,
+}
+
+
+# Upper bounds (exclusive) of the values which _encode_int writes inline or
+# with a 1, 2, 4 or 8 byte argument
+_INT_WIDTHS = ((24, 0), (1 << 8, 1), (1 << 16, 2), (1 << 32, 4),
+               (1 << 64, 8))
+_INT_FORMATS = {1: 'B', 2: 'H', 4: 'I', 8: 'Q'}
 
+# Arrays shorter than this are not worth checking for a common item type
+_BULK_MIN_LENGTH = 8
+
+
+def _int_width(data):
+    for bound, width in _INT_WIDTHS:
+        if data < bound:
+            return width
+
+
+def _interleave(header, packed, width, count):
+    # Put a copy of the header byte in front of each packed value
+    encoded = bytearray((width + 1) * count)
+    encoded[0::width + 1] = bytes([header]) * count
+    for i in range(width):
+        encoded[i + 1::width + 1] = packed[i::width]
     return encoded
 
 
-def _single_to_half(single):
-    f = struct.unpack('>I', struct.pack('>f', single))[0]
+def _encode_int_array(data):
+    low = min(data)
+    high = max(data)
+    if low >= 0:
+        major_type = 0
+    elif high < 0:
+        major_type = 1
+        low, high = ~high, ~low
+        data = list(map(operator.invert, data))
+    else:
+        return None
+
+    width = _int_width(high)
+    if width is None or _int_width(low) != width:
+        return None
+
+    if width == 0:
+        return bytes(map((major_type << 5).__or__, data))
+
+    code = 24 + (1, 2, 4, 8).index(width)
+    packed = struct.pack('>%d%s' % (len(data), _INT_FORMATS[width]), *data)
+    return _interleave((major_type << 5) + code, packed, width, len(data))
+
+
+def _encode_float_array(data, float_mode):
+    count = len(data)
+    if float_mode == 'double':
+        return _interleave((7 << 5) + 27, struct.pack('>%dd' % count, *data),
+                           8, count)
+    elif float_mode == 'single':
+        return _interleave((7 << 5) + 26, struct.pack('>%df' % count, *data),
+                           4, count)
+
+    if any(map(math.isnan, data)):
+        return None
+
+    singles = array.array('f', data)
+    single_exact = list(map(operator.eq, singles, data))
+    if not any(single_exact):
+        return _interleave((7 << 5) + 27, struct.pack('>%dd' % count, *data),
+                           8, count)
+    elif not all(single_exact):
+        return None
+
+    try:
+        halves = struct.pack('>%de' % count, *data)
+    except OverflowError:
+        return None
+
+    half_exact = list(map(operator.eq,
+                          struct.unpack('>%de' % count, halves), data))
+    if all(half_exact):
+        return _interleave((7 << 5) + 25, halves, 2, count)
+    elif not any(half_exact):
+        if sys.byteorder == 'little':
+            singles.byteswap()
+        return _interleave((7 << 5) + 26, singles.tobytes(), 4, count)
 
-    # http://stackoverflow.com/questions/6162651/
-    # Check if float is subnormal
-    if f < 0x38800000:
-        # Too small for subnormal, must use +/- 0.0
-        if f < 0x33000000:
-            return math.copysign(single, 0.0)
 
-        # Get sign bit and temporary exponent
-        sign = (f >> 16) & 0x8000
-        val = (f & 0x7fffffff ) >> 23
+def _scatter(numpy, count, groups):
+    # Lay out items of varying widths given (headers, mask, payload) groups
+    # where payload holds the big-endian arguments of the masked items
+    sizes = numpy.ones(count, numpy.intp)
+    for headers, mask, payload in groups:
+        if payload is not None:
+            sizes[mask] += payload.itemsize
+    starts = numpy.cumsum(sizes) - sizes
 
-        # Add the subnormal bit, round, divde by 2^(1-(exp-127+15))
-        # and >> 13 | exp=0
-        return sign | ((f & 0x7fffff | 0x800000)
-                        + (0x800000 >> val - 102)
-                        >> 126 - val) # div by 2^(1-(exp-127+15)) and >> 13 | exp=0
+    encoded = numpy.empty(int(sizes.sum()), numpy.uint8)
+    for headers, mask, payload in groups:
+        positions = starts[mask]
+        encoded[positions] = headers
+        if payload is not None and len(positions):
+            width = payload.itemsize
+            encoded[(positions + 1)[:, None] + numpy.arange(width)] = \
+                payload[mask].view(numpy.uint8).reshape(-1, width)
+    return memoryview(encoded)
+
+
+def _encode_int_array_numpy(data, numpy):
+    try:
+        values = numpy.array(data, numpy.int64)
+    except OverflowError:
+        return None
+
+    negative = values < 0
+    magnitudes = numpy.where(negative, ~values, values).astype(numpy.uint64)
+    major_types = negative.astype(numpy.uint8) << 5
+
+    groups = []
+    lower = 0
+    for bound, width in _INT_WIDTHS:
+        mask = (magnitudes >= lower) & (magnitudes < bound)
+        if width == 0:
+            groups.append((major_types[mask] | magnitudes[mask].astype(
+                numpy.uint8), mask, None))
+        else:
+            code = 24 + (1, 2, 4, 8).index(width)
+            groups.append((major_types[mask] | code, mask,
+                           magnitudes.astype('>u%d' % width)))
+        lower = bound
+
+    return _scatter(numpy, len(data), groups)
+
+
+def _encode_float_array_numpy(data, numpy):
+    values = numpy.array(data, numpy.float64)
+    with numpy.errstate(over='ignore', invalid='ignore'):
+        halves = values.astype('>f2')
+        singles = values.astype('>f4')
+
+    nan = numpy.isnan(values)
+    halves[nan] = numpy.nan
+    half = nan | (halves == values)
+    single = ~half & (singles == values)
+    double = ~half & ~single
+
+    return _scatter(numpy, len(data), (
+        ((7 << 5) + 25, half, halves),
+        ((7 << 5) + 26, single, singles),
+        ((7 << 5) + 27, double, values.astype('>f8')),
+    ))
+
+
+def _encode_number_array(data, float_mode):
+    types = set(map(type, data))
+    if types == {int}:
+        encoded = _encode_int_array(data)
+        bulk_numpy = _encode_int_array_numpy
+    elif types == {float}:
+        encoded = _encode_float_array(data, float_mode)
+        bulk_numpy = _encode_float_array_numpy
     else:
-        # ftp://ftp.fox-toolkit.org/pub/fasthalffloatconversion.pdf
-        # 1) Sign bit is shifted and masked;
-        # 2) Exponent (5 bits) is masked and bias-correction subtracted; result shifted and masked;
-        # 3) Mantissa (10 bits) is shifted and masked;
-        # Result is assembled by or-ing those 3.
-        # This ignores rounding and doesn't handle zero, inf, nan or subnormals.
-        return ((f >> 16) & 0x8000) | \
-                ((((f & 0x7f800000) - 0x38000000) >> 13) & 0x7c00) | \
-                ((f >> 13) & 0x03ff)
+        return None
 
+    if encoded is None:
+        # Items need different widths, which NumPy can still handle in bulk
+        numpy = sys.modules.get('numpy')
+        if numpy is not None:
+            encoded = bulk_numpy(data, numpy)
 
-def _half_to_float(half):
-    # Half is 16-bit int
-    single = (half & 0x7fff) << 13 | (half & 0x8000) << 16
-    if (half & 0x7c00) != 0x7c00:
-        mant = half & 0x03ff
-        exp = half & 0x7c00
-        if mant and exp == 0:
-            exp = 0x1c400
+    return encoded
 
-            while (mant & 0x400) == 0:
-                mant <<= 1
-                exp -= 0x400
 
-            mant &= 0x3ff
-            single = (half & 0x8000) << 16 | (exp | mant) << 13
+# RFC 8746 typed arrays are tagged byte strings where the tag encodes the
+# element type as 0b010_f_s_e_ll (float, signed, little endian, length)
+_TYPED_ARRAY_TAGS = {}
+for _ll, _size in enumerate((1, 2, 4, 8)):
+    for _e in (0, 1):
+        if _size > 1 or not _e:
+            _TYPED_ARRAY_TAGS[64 | _e << 2 | _ll] = ('u', _size, _e)
+            _TYPED_ARRAY_TAGS[72 | _e << 2 | _ll] = ('i', _size, _e)
+# uint8 with clamped arithmetic
+_TYPED_ARRAY_TAGS[68] = ('u', 1, 0)
+for _ll, _size in enumerate((2, 4, 8, 16)):
+    for _e in (0, 1):
+        _TYPED_ARRAY_TAGS[80 | _e << 2 | _ll] = ('f', _size, _e)
 
-            return struct.unpack('>f', struct.pack('>I', single))[0]
+# Map element types to array typecodes and back, preferring the first
+# typecode listed when several have the same size
+_ARRAY_TYPECODES = {}
+_ARRAY_KINDS = {}
+for _kind, _typecodes in (('u', 'BHILQ'), ('i', 'bhilq'), ('f', 'fd')):
+    for _typecode in reversed(_typecodes):
+        _size = array.array(_typecode).itemsize
+        _ARRAY_TYPECODES[_kind, _size] = _typecode
+        _ARRAY_KINDS[_typecode] = (_kind, _size)
 
-        return math.ldexp(struct.unpack('>f', struct.pack('>I', single))[0], 112)
+_NATIVE_LITTLE = int(sys.byteorder == 'little')
 
-    single |= 0x7f800000
-    return struct.unpack('>f', struct.pack('>I', single))[0]
 
+def _typed_array_tag(kind, size, little):
+    if kind == 'f':
+        return 80 | little << 2 | (2, 4, 8, 16).index(size)
 
-def _encode_float(data):
-    encoded = b''
+    tag = 64 | (kind == 'i') << 3 | (1, 2, 4, 8).index(size)
+    if size > 1:
+        tag |= little << 2
+    return tag
+
+
+def _string_reference_min_length(index):
+    # Strings are only worth referencing if they are at least as long as
+    # the reference to them would be
+    if index < 24:
+        return 3
+    elif index < 256:
+        return 4
+    elif index < 65536:
+        return 5
+    elif index < 4294967296:
+        return 7
+    return 11
 
-    if data == 0.0:
-        if math.copysign(1.0, data) < 0:
-            # -0.0
-            encoded += b'\xf9\x80\x00'
+
+def _find_shared(data):
+    # Find the ids of the lists, tuples and dicts which are reachable more
+    # than once, which includes any that contain themselves
+    seen = set()
+    shared = set()
+    pending = [data]
+    while pending:
+        item = pending.pop()
+        if isinstance(item, list) or isinstance(item, tuple):
+            children = item
+        elif isinstance(item, dict):
+            children = itertools.chain(item.keys(), item.values())
         else:
-            # 0.0
-            encoded += b'\xf9\x00\x00'
-    elif math.isinf(data):
-        if math.copysign(1.0, data) < 0:
-            encoded += b'\xf9\xfc\x00'
+            continue
+
+        if id(item) in seen:
+            shared.add(id(item))
         else:
-            encoded += b'\xf9\x7c\x00'
-    elif math.isnan(data):
-        encoded += b'\xf9\x7e\x00'
-    else:
-        single_array = array.array('f', [data])
-        if single_array[0] == data:
-            half = _single_to_half(single_array[0])
+            seen.add(id(item))
+            pending.extend(children)
 
-            if _half_to_float(half) == single_array[0]:
-                # Half-precision
-                encoded += bytes([(7 << 5) + 25])
-                encoded += struct.pack('>H', half)
+    return shared
+
+
+class Tag:
+    __slots__ = ('tag', 'value')
+
+    def __init__(self, tag, value):
+        self.tag = tag
+        self.value = value
+
+    def __eq__(self, other):
+        if not isinstance(other, Tag):
+            return NotImplemented
+        return self.tag == other.tag and self.value == other.value
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __hash__(self):
+        return hash((self.tag, self.value))
+
+    def __repr__(self):
+        return 'Tag(%d, %r)' % (self.tag, self.value)
+
+
+class Raw:
+    # Already encoded CBOR which the encoder writes out as it is
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+    def __eq__(self, other):
+        if not isinstance(other, Raw):
+            return NotImplemented
+        return self.data == other.data
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __hash__(self):
+        return hash(bytes(self.data))
+
+    def __repr__(self):
+        return 'Raw(%r)' % (bytes(self.data),)
+
+
+class ByteStream:
+    # Byte string chunks from an iterable or a file object, encoded as an
+    # indefinite-length string without joining them
+    __slots__ = ('source', 'chunk_size')
+
+    _major_type = 2
+
+    def __init__(self, source, chunk_size=1 << 16):
+        self.source = source
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        read = getattr(self.source, 'read', None)
+        if read is None:
+            return iter(self.source)
+        return self._read_chunks(read)
+
+    def _read_chunks(self, read):
+        while True:
+            chunk = read(self.chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+class TextStream(ByteStream):
+    __slots__ = ()
+
+    _major_type = 3
+
+
+class IndefiniteMap:
+    # Key and value pairs from an iterable, encoded as an indefinite-length
+    # map as they are produced
+    __slots__ = ('pairs',)
+
+    def __init__(self, pairs):
+        self.pairs = pairs
+
+
+def _encode_datetime(encoder, data):
+    if data.tzinfo is None:
+        raise ValueError('cannot encode naive datetime %s' % data)
+
+    # Whole seconds are written as integers, which are shorter and faster to
+    # decode than floats
+    timestamp = data.timestamp()
+    if not data.microsecond:
+        timestamp = int(timestamp)
+    return Tag(1, timestamp)
+
+
+def _encode_decimal(encoder, data):
+    sign, digits, exponent = data.as_tuple()
+    if not isinstance(exponent, int):
+        # NaN and infinities
+        return float(data)
+
+    mantissa = int(''.join(map(str, digits)))
+    return Tag(4, [exponent, -mantissa if sign else mantissa])
+
+
+def _encode_fraction(encoder, data):
+    return Tag(30, [data.numerator, data.denominator])
+
+
+def _encode_uuid(encoder, data):
+    return Tag(37, data.bytes)
+
+
+def _encode_ip_address(encoder, data):
+    return Tag(52 if data.version == 4 else 54, data.packed)
+
+
+def _encode_ip_network(encoder, data):
+    # Networks omit the trailing zero bytes of their address
+    return Tag(52 if data.version == 4 else 54,
+               [data.prefixlen, data.network_address.packed.rstrip(b'\0')])
+
+
+def _encode_ip_interface(encoder, data):
+    return Tag(52 if data.version == 4 else 54,
+               [data.packed, data.network.prefixlen])
+
+
+# Functions which take an encoder and a value of a given type and return
+# something the encoder already knows how to write, usually a Tag
+_encoders = {
+    datetime.datetime: _encode_datetime,
+    decimal.Decimal: _encode_decimal,
+    fractions.Fraction: _encode_fraction,
+    uuid.UUID: _encode_uuid,
+    ipaddress.IPv4Address: _encode_ip_address,
+    ipaddress.IPv6Address: _encode_ip_address,
+    ipaddress.IPv4Network: _encode_ip_network,
+    ipaddress.IPv6Network: _encode_ip_network,
+    ipaddress.IPv4Interface: _encode_ip_interface,
+    ipaddress.IPv6Interface: _encode_ip_interface,
+}
+
+
+def register_encoder(type_, function):
+    _encoders[type_] = function
+
+
+# Types whose encoding is kept when caching is turned on, and the length below
+# which strings are cheaper to encode again than to look up
+_CACHED_TYPES = (str, bytes, tuple, frozenset)
+_CACHE_MIN_LENGTH = 32
+
+# Values of these types cannot change once created. Tuples and frozensets are
+# only cached when everything inside them is one of these.
+_IMMUTABLE_TYPES = frozenset([str, bytes, int, float, bool, type(None)])
+
+
+def _is_immutable(data):
+    if data.__class__ in _IMMUTABLE_TYPES:
+        return True
+    if data.__class__ is tuple or data.__class__ is frozenset:
+        return all(map(_is_immutable, data))
+    return False
+
+
+class Encoder:
+    def __init__(self, bulk_arrays=False, float_mode='shortest',
+                 encoders=None, string_referencing=False,
+                 value_sharing=False, canonical=False, chunk_size=1 << 16,
+                 cache_size=0, cache_bytes=1 << 20):
+        if float_mode not in _FLOAT_ENCODERS:
+            raise ValueError('unknown float mode %r' % (float_mode,))
+        if canonical and float_mode != 'shortest':
+            raise ValueError('canonical encoding requires shortest floats')
+
+        self._bulk_arrays = bulk_arrays
+        self._canonical = canonical
+        self._string_referencing = string_referencing
+        self._string_references = None
+        self._value_sharing = value_sharing
+        self._shared = None
+        self._shared_count = 0
+        self._float_mode = float_mode
+        self._float_encoder = _FLOAT_ENCODERS[float_mode]
+        self._buffer = bytearray()
+        self._pos = 0
+        self._chunk_size = chunk_size
+        self._sink = None
+
+        self._encoders = _encoders
+        if encoders:
+            self._encoders = dict(_encoders)
+            self._encoders.update(encoders)
+
+        # Handlers for each exact type seen so far. The methods for the
+        # built-in types are bound the first time they are needed.
+        self._handlers = {}
+        if canonical:
+            self._handlers[dict] = self._encode_sorted_map
+
+        self._cache = None
+        if cache_size:
+            self._cache = collections.OrderedDict()
+            self._cache_size = cache_size
+            self._cache_bytes = cache_bytes
+            self._cached_bytes = 0
+            for type_ in _CACHED_TYPES:
+                handler = self._handlers.get(type_) or \
+                    self._find_handler(type_)
+                self._handlers[type_] = functools.partial(self._encode_cached,
+                                                          handler)
+
+    def reset(self):
+        # Keep the allocated buffer around so it can be reused by the next
+        # call instead of growing a fresh one from scratch
+        self._pos = 0
+
+    def _write(self, data):
+        pos = self._pos
+        end = pos + len(data)
+        self._buffer[pos:end] = data
+        self._pos = end
+
+    def __len__(self):
+        return self._pos
+
+    def getvalue(self):
+        with memoryview(self._buffer) as view:
+            return bytes(view[:self._pos])
+
+    def getbuffer(self):
+        # The view must be released before the encoder is used again
+        with memoryview(self._buffer) as view:
+            return view[:self._pos]
+
+    def append(self, data):
+        self._encode_root(data)
+
+    def encode(self, data):
+        self.reset()
+        self._encode_root(data)
+        return self.getvalue()
+
+    def encode_into(self, data, buffer, offset=0):
+        # Encode straight into the given buffer instead of the internal one
+        with memoryview(buffer) as target, target.cast('B') as octets:
+            if not 0 <= offset <= len(octets):
+                raise ValueError('offset %d is outside the buffer' % offset)
+
+            own_buffer = self._buffer
+            self._buffer = octets
+            self._pos = offset
+            self._write = self._write_into
+            try:
+                self._encode_root(data)
+                return self._pos
+            finally:
+                del self._write
+                self._buffer = own_buffer
+                self._pos = 0
+
+    def _write_into(self, data):
+        pos = self._pos
+        end = pos + len(data)
+        if end > len(self._buffer):
+            raise ValueError('buffer too small for encoded value')
+        self._buffer[pos:end] = data
+        self._pos = end
+
+    def encode_to(self, data, write):
+        # Pass the encoded value to write in chunks of about chunk_size bytes
+        # as it is produced, so that it never has to be held in memory whole
+        self.reset()
+        self._sink = write
+        self._write = self._write_chunked
+        try:
+            self._encode_root(data)
+            self._flush()
+        finally:
+            del self._write
+            self._sink = None
+            self._pos = 0
+
+    def _write_chunked(self, data):
+        Encoder._write(self, data)
+        if self._pos >= self._chunk_size and self._sink is not None:
+            self._flush()
+
+    def _flush(self):
+        with memoryview(self._buffer) as view, view[:self._pos] as chunk:
+            self._sink(chunk)
+        self._pos = 0
+
+    def _encode_root(self, data):
+        if self._value_sharing:
+            self._shared = dict.fromkeys(_find_shared(data))
+            self._shared_count = 0
+        try:
+            if self._string_referencing:
+                # Each encoded value gets its own string reference namespace
+                self._write(b'\xd9\x01\x00')
+                self._string_references = {}
+            self._encode_value(data)
+        finally:
+            self._string_references = None
+            self._shared = None
+
+    def _encode_value(self, data):
+        handler = self._handlers.get(data.__class__)
+        if handler is None:
+            handler = self._find_handler(data.__class__)
+        handler(data)
+
+    def _find_handler(self, cls):
+        # The built-in types are handled the same way even when an encoder
+        # is registered for them, so they are not slowed down by one
+        function = _builtin_handlers.get(cls)
+        if function is not None:
+            handler = self._handlers[cls] = function.__get__(self)
+            return handler
+
+        for base in cls.__mro__:
+            if base in self._encoders:
+                function = self._encoders[base]
+
+                def handler(data):
+                    self._encode_value(function(self, data))
+                break
+            elif base in self._handlers:
+                handler = self._handlers[base]
+                break
+            elif base in _builtin_handlers:
+                handler = _builtin_handlers[base].__get__(self)
+                break
+        else:
+            # Only look for arrays if something has already imported NumPy
+            numpy = sys.modules.get('numpy')
+            if numpy is not None and issubclass(cls, numpy.ndarray):
+                def handler(data):
+                    self._encode_ndarray(data, numpy)
+            elif dataclasses.is_dataclass(cls):
+                handler = functools.partial(_class_schema(cls)._encode_record,
+                                            self)
+            elif issubclass(cls, Mapping):
+                handler = self._encode_sorted_map if self._canonical \
+                    else self._encode_map
+            elif issubclass(cls, ItemsView):
+                handler = self._encode_items
+            elif issubclass(cls, Iterable):
+                handler = self._encode_iterable
+            elif cls.__dict__.get('__slots__'):
+                # Only classes which declare slots themselves are records.
+                # Subclasses of library classes with private slots, such as
+                # pathlib paths, still cannot be encoded.
+                handler = functools.partial(_class_schema(cls)._encode_record,
+                                            self)
             else:
-                # Single-precision
-                encoded += bytes([(7 << 5) + 26])
-                encoded += struct.pack('>f', single_array[0])
+                raise TypeError('cannot encode values of type %s'
+                                % cls.__name__)
+
+        self._handlers[cls] = handler
+        return handler
+
+    def _encode_cached(self, handler, data):
+        # The encoding of strings and references depends on what has been
+        # written before, so only cache when neither is in use
+        if self._string_references is not None or self._shared is not None:
+            handler(data)
+            return
+
+        # Strings are looked up by value. Tuples and frozensets can be equal
+        # while encoding differently, like (1,) and (1.0,), so they are
+        # looked up by identity and kept alive by the cache.
+        if data.__class__ is str or data.__class__ is bytes:
+            if len(data) < _CACHE_MIN_LENGTH:
+                handler(data)
+                return
+            key = data
         else:
-            # Double-precision
-            encoded += bytes([(7 << 5) + 27])
-            encoded += struct.pack('>d', data)
+            # Objects inside can be changed in place even if they can be
+            # hashed, so only keep values built from immutable types
+            if not _is_immutable(data):
+                handler(data)
+                return
+            key = id(data)
 
-    return encoded
+        cache = self._cache
+        entry = cache.get(key)
+        if entry is not None and (key is data or entry[0] is data):
+            cache.move_to_end(key)
+            self._write(entry[1])
+            return
+
+        start = self._pos
+        sink = self._sink
+        self._sink = None
+        try:
+            handler(data)
+        finally:
+            self._sink = sink
+
+        encoded = bytes(self._buffer[start:self._pos])
+        if len(encoded) <= self._cache_bytes:
+            if entry is not None:
+                self._cached_bytes -= len(cache.pop(key)[1])
+            cache[key] = (data, encoded)
+            self._cached_bytes += len(encoded)
+            while len(cache) > self._cache_size or \
+                    self._cached_bytes > self._cache_bytes:
+                self._cached_bytes -= len(cache.popitem(last=False)[1][1])
+
+        if sink is not None and self._pos >= self._chunk_size:
+            self._flush()
+
+    def _encode_shared(self, data):
+        # Containers which appear more than once are written in full the
+        # first time and as a reference to the first copy after that
+        index = self._shared[id(data)]
+        if index is not None:
+            self._write(b'\xd8\x1d')
+            self._write(_encode_int(index, 0))
+            return True
 
+        self._shared[id(data)] = self._shared_count
+        self._shared_count += 1
+        self._write(b'\xd8\x1c')
+        return False
 
-def encode(data):
-    encoded = b''
+    def _encode_array(self, data):
+        if self._shared and id(data) in self._shared and \
+                self._encode_shared(data):
+            return
+
+        self._write(_encode_int(len(data), 4))
+        if self._bulk_arrays and len(data) >= _BULK_MIN_LENGTH:
+            encoded = _encode_number_array(data, self._float_mode)
+            if encoded is not None:
+                self._write(encoded)
+                return
 
-    if isinstance(data, list) or isinstance(data, tuple):
-        encoded += _encode_int(len(data), 4)
         for item in data:
-            encoded += encode(item)
-        return encoded
+            self._encode_value(item)
 
-    if isinstance(data, dict):
-        encoded += _encode_int(len(data), 5)
+    def _encode_map(self, data):
+        if self._shared and id(data) in self._shared and \
+                self._encode_shared(data):
+            return
+
+        self._write(_encode_int(len(data), 5))
         for key, value in data.items():
-            encoded += encode(key)
-            encoded += encode(value)
-        return encoded
+            self._encode_value(key)
+            self._encode_value(value)
+
+    def _encode_sorted_map(self, data):
+        if self._shared and id(data) in self._shared and \
+                self._encode_shared(data):
+            return
+
+        keys = list(data)
+        items = sorted(zip(self._encode_each(keys), keys),
+                       key=operator.itemgetter(0))
+
+        self._write(_encode_int(len(items), 5))
+        for encoded, key in items:
+            self._write_sorted(encoded, key)
+            self._encode_value(data[key])
 
-    simple = {
-        False: 20,
-        True: 21,
-        None: 22,
-    }
+    def _encode_sorted_set(self, data):
+        elements = list(data)
+        items = sorted(zip(self._encode_each(elements), elements),
+                       key=operator.itemgetter(0))
 
-    if data is True or data is False or data is None:
-        encoded += bytes([(7 << 5) + simple[data]])
+        self._write(_encode_int(len(items), 4))
+        for encoded, element in items:
+            self._write_sorted(encoded, element)
+
+    def _encode_each(self, values):
+        # Encode each value once at the end of the buffer so they can be
+        # sorted on their encoded bytes. References would depend on the
+        # order the values are written in, so they are left out for now.
+        start = self._pos
+        references = self._string_references
+        shared = self._shared
+        sink = self._sink
+        self._string_references = self._shared = self._sink = None
+        try:
+            encoded = []
+            for value in values:
+                self._encode_value(value)
+                encoded.append(bytes(self._buffer[start:self._pos]))
+                self._pos = start
+        finally:
+            self._string_references = references
+            self._shared = shared
+            self._sink = sink
         return encoded
 
-    if isinstance(data, int):
+    def _write_sorted(self, encoded, value):
+        if self._string_references is None and self._shared is None:
+            self._write(encoded)
+        else:
+            self._encode_value(value)
+
+    def _encode_simple(self, data):
+        simple = {
+            False: 20,
+            True: 21,
+            None: 22,
+        }
+
+        self._write(bytes([(7 << 5) + simple[data]]))
+
+    def _encode_integer(self, data):
         if data < 0:
             data = -1 - data
             major_type = 1
         else:
             major_type = 0
 
-        encoded += _encode_int(data, major_type)
-        return encoded
+        if data > 0xffffffffffffffff:
+            # Bignums are tag 2 (or 3 for negative numbers) followed by
+            # the big-endian bytes of the value
+            self._write(_encode_int(2 + major_type, 6))
+            self._encode_view(memoryview(
+                data.to_bytes((data.bit_length() + 7) // 8, 'big')))
+        else:
+            self._write(_encode_int(data, major_type))
 
-    if isinstance(data, bytes):
-        encoded += _encode_int(len(data), 2)
-        encoded += data
-        return encoded
+    def _encode_float(self, data):
+        self._write(self._float_encoder(data))
 
-    if isinstance(data, str):
-        encoded += _encode_int(len(data), 3)
-        encoded += data.encode('utf8')
-        return encoded
+    def _encode_bytes(self, data):
+        # The decoder adds every definite-length byte string to the
+        # namespace, so bytearrays are added too, keyed by an equal bytes
+        if self._string_references is not None and \
+                self._encode_string_reference(
+                    data if data.__class__ is bytes else bytes(data),
+                    data, len(data)):
+            return
+
+        self._write(_encode_int(len(data), 2))
+        self._write(data)
+
+    def _encode_text(self, data):
+        encoded = data.encode('utf8')
+        if self._string_references is not None and \
+                self._encode_string_reference(data, encoded, len(encoded)):
+            return
+
+        self._write(_encode_int(len(encoded), 3))
+        self._write(encoded)
+
+    def _encode_string_reference(self, data, encoded, length):
+        # Text and byte strings never compare equal, so both can share one
+        # namespace keyed by the strings themselves
+        references = self._string_references
+        index = references.get(data)
+        if index is not None:
+            self._write(b'\xd8\x19')
+            self._write(_encode_int(index, 0))
+            return True
+
+        if length >= _string_reference_min_length(len(references)):
+            references[data] = len(references)
+        return False
+
+    def _encode_tag(self, data):
+        self._write(_encode_int(data.tag, 6))
+        self._encode_value(data.value)
+
+    def _encode_stream(self, data):
+        major_type = data._major_type
+        if self._canonical:
+            # Canonical encoding only allows definite lengths
+            if major_type == 3:
+                self._encode_text(''.join(data))
+            else:
+                self._encode_bytes(b''.join(data))
+            return
+
+        # Chunks are never added to string references since they cannot be
+        # referred to on their own
+        self._write(bytes([(major_type << 5) + 31]))
+        for chunk in data:
+            if major_type == 3:
+                if not isinstance(chunk, str):
+                    raise TypeError('text stream chunks must be str, not %s'
+                                    % chunk.__class__.__name__)
+                chunk = chunk.encode('utf8')
+            elif isinstance(chunk, str):
+                raise TypeError('byte stream chunks must not be str')
+            elif chunk.__class__ is memoryview:
+                chunk = chunk.cast('B')
+
+            if chunk:
+                self._write(_encode_int(len(chunk), major_type))
+                self._write(chunk)
+        self._write(b'\xff')
+
+    def _encode_indefinite_map(self, data):
+        if self._canonical:
+            self._encode_sorted_map(dict(data.pairs))
+            return
 
-    if isinstance(data, collections.Iterable):
-        encoded += bytes([(4 << 5) + 31])
+        self._write(bytes([(5 << 5) + 31]))
+        for key, value in data.pairs:
+            self._encode_value(key)
+            self._encode_value(value)
+        self._write(b'\xff')
+
+    def _encode_items(self, data):
+        if self._canonical:
+            self._encode_sorted_map(dict(data))
+            return
+
+        self._write(_encode_int(len(data), 5))
+        for key, value in data:
+            self._encode_value(key)
+            self._encode_value(value)
+
+    def _encode_raw(self, data):
+        # Strings inside the raw data would be added to the namespace by the
+        # decoder, so give them a namespace of their own
+        if self._string_references is not None:
+            self._write(b'\xd9\x01\x00')
+        self._write(data.data)
+
+    def _encode_iterable(self, data):
+        if self._canonical:
+            # Canonical encoding only allows definite lengths, and sets are
+            # sorted since their order changes with the hash seed
+            if isinstance(data, (set, frozenset)):
+                self._encode_sorted_set(data)
+            else:
+                self._encode_array(list(data))
+            return
+
+        self._write(bytes([(4 << 5) + 31]))
         for item in data:
-            encoded += encode(item)
-        encoded += b'\xff'
-        return encoded
+            self._encode_value(item)
+        self._write(b'\xff')
 
-    if isinstance(data, float):
-        encoded += _encode_float(data)
-        return encoded
+    def _encode_typed_array(self, data):
+        if data.typecode not in _ARRAY_KINDS:
+            self._encode_iterable(data)
+            return
+
+        kind, size = _ARRAY_KINDS[data.typecode]
+        self._write(_encode_int(
+            _typed_array_tag(kind, size, _NATIVE_LITTLE), 6))
+        self._encode_view(memoryview(data))
+
+    def _encode_view(self, view):
+        if view.c_contiguous:
+            view = view.cast('B')
+        else:
+            view = view.tobytes()
+
+        if self._string_references is not None and \
+                self._encode_string_reference(bytes(view), view, len(view)):
+            return
+
+        self._write(_encode_int(len(view), 2))
+        self._write(view)
 
+    def _encode_ndarray(self, data, numpy):
+        if data.ndim == 0:
+            self._encode_value(data.item())
+            return
 
-def _decode_int(value, data):
+        if data.ndim > 1:
+            # Multi-dimensional arrays are a pair of the shape and the flat
+            # elements, in column-major order if that avoids a copy
+            if data.flags.f_contiguous and not data.flags.c_contiguous:
+                self._write(_encode_int(1040, 6))
+                flat = data.ravel(order='F')
+            else:
+                self._write(_encode_int(40, 6))
+                flat = data.ravel()
+
+            self._write(_encode_int(2, 4))
+            self._encode_value(list(data.shape))
+            data = flat
+
+        dtype = data.dtype
+        sizes = (2, 4, 8) if dtype.kind == 'f' else (1, 2, 4, 8)
+        if dtype.kind not in 'uif' or dtype.itemsize not in sizes:
+            self._encode_value(data.tolist())
+            return
+
+        if dtype.byteorder == '=':
+            little = _NATIVE_LITTLE
+        else:
+            little = int(dtype.byteorder == '<')
+
+        self._write(_encode_int(
+            _typed_array_tag(dtype.kind, dtype.itemsize, little), 6))
+        self._encode_view(memoryview(
+            numpy.ascontiguousarray(data).view(numpy.uint8)))
+
+
+# Methods of Encoder for values of each built-in type
+_builtin_handlers = {
+    list: Encoder._encode_array,
+    tuple: Encoder._encode_array,
+    dict: Encoder._encode_map,
+    bool: Encoder._encode_simple,
+    type(None): Encoder._encode_simple,
+    int: Encoder._encode_integer,
+    float: Encoder._encode_float,
+    bytes: Encoder._encode_bytes,
+    bytearray: Encoder._encode_bytes,
+    memoryview: Encoder._encode_view,
+    str: Encoder._encode_text,
+    array.array: Encoder._encode_typed_array,
+    Tag: Encoder._encode_tag,
+    Raw: Encoder._encode_raw,
+    ByteStream: Encoder._encode_stream,
+    TextStream: Encoder._encode_stream,
+    IndefiniteMap: Encoder._encode_indefinite_map,
+}
+
+
+# Encoder and decoder reused by calls without options, one per thread, and
+# the largest buffer the encoder keeps between calls
+_local = threading.local()
+_REUSED_BUFFER_SIZE = 1 << 16
+
+
+def _default_encoder(method, *args):
+    # Take the encoder while it is in use, so that a nested call from a
+    # registered encoder function gets a new one
+    encoder = getattr(_local, 'encoder', None) or Encoder()
+    _local.encoder = None
+    try:
+        return method(encoder, *args)
+    finally:
+        if len(encoder._buffer) > _REUSED_BUFFER_SIZE:
+            encoder._buffer = bytearray()
+        _local.encoder = encoder
+
+
+def encode(data, **options):
+    if options:
+        return Encoder(**options).encode(data)
+    return _default_encoder(Encoder.encode, data)
+
+
+def encode_into(data, buffer, offset=0, **options):
+    if options:
+        return Encoder(**options).encode_into(data, buffer, offset)
+    return _default_encoder(Encoder.encode_into, data, buffer, offset)
+
+
+def dump(data, fp, **options):
+    Encoder(**options).encode_to(data, fp.write)
+
+
+def digest(data, algorithm='sha256', **options):
+    hash_object = hashlib.new(algorithm)
+    Encoder(**options).encode_to(data, hash_object.update)
+    return hash_object.digest()
+
+
+def _decode_int(value, data, offset):
     if 0 <= value <= 23:
         return (1, value)
     elif value == 24:
-        return (2, struct.unpack('>B', data[:1])[0])
+        return (2, data[offset])
     elif value == 25:
-        return (3, struct.unpack('>H', data[:2])[0])
+        return (3, struct.unpack_from('>H', data, offset)[0])
     elif value == 26:
-        return (4, struct.unpack('>I', data[:4])[0])
+        return (5, struct.unpack_from('>I', data, offset)[0])
     elif value == 27:
-        return (5, struct.unpack('>Q', data[:8])[0])
+        return (9, struct.unpack_from('>Q', data, offset)[0])
 
+    raise ValueError('invalid additional information %d' % value)
 
-def _decode_value(offset, data):
-    major_type = data[offset] >> 5
-    extra = data[offset] & ~(major_type << 5)
-    value = None
 
-    if major_type == 0:
-        offset_inc, value = _decode_int(extra, data[1 + offset:])
-        offset += offset_inc
+def _intern_key(raw):
+    return sys.intern(str(raw, 'utf8'))
 
-    if major_type == 1:
-        offset_inc, value = _decode_int(extra, data[1 + offset:])
-        offset += offset_inc
-        value = -1 - value
 
-    if major_type == 2:
-        if extra == 31:
-            offset += 1
-            value = b''
-            while data[offset] != 0xFF:
-                offset, item = _decode_value(offset, data)
-                value += bytes(item)
-            offset += 1
-        else:
-            offset_inc, value_len = _decode_int(extra, data[1 + offset:])
+def _key_index(keys):
+    return dict(zip(keys, range(len(keys))))
+
+
+def _decode_float_run(data, offset, initial, limit):
+    width = (2, 4, 8)[initial - 0xf9]
+    step = width + 1
+    available = (len(data) - offset) // step
+    if limit is None or limit > available:
+        limit = available
+
+    # Count how many of the following items start with the same header. The
+    # headers are looked at in windows of growing size, so that finding a
+    # short run does not cost a scan of the whole rest of the array.
+    header = bytes([initial])
+    count = 0
+    window = 8
+    while count < limit:
+        size = min(window, limit - count)
+        start = offset + count * step
+        headers = bytes(data[start:start + size * step:step])
+        matched = len(headers) - len(headers.lstrip(header))
+        count += matched
+        if matched < size:
+            break
+        window *= 2
+    if not count:
+        raise ValueError('truncated float')
+
+    end = offset + count * step
+    packed = bytearray(width * count)
+    for i in range(width):
+        packed[i::width] = bytes(data[offset + 1 + i:end:step])
+
+    if width == 2:
+        floats = array.array('d', struct.unpack('>%de' % count, packed))
+    else:
+        floats = array.array('f' if width == 4 else 'd')
+        floats.frombytes(packed)
+        if sys.byteorder == 'little':
+            floats.byteswap()
+        if width == 4:
+            floats = array.array('d', floats)
+
+    return (end, floats)
+
+
+def _decode_datetime_string(decoder, value):
+    # fromisoformat only accepts a Z suffix from Python 3.11
+    if value[-1:] in ('Z', 'z'):
+        value = value[:-1] + '+00:00'
+    return datetime.datetime.fromisoformat(value)
+
+
+def _decode_epoch_datetime(decoder, value):
+    return datetime.datetime.fromtimestamp(value, datetime.timezone.utc)
+
+
+def _decode_decimal(decoder, value):
+    exponent, mantissa = value
+    sign, digits, _ = decimal.Decimal(mantissa).as_tuple()
+    return decimal.Decimal((sign, digits, exponent))
+
+
+def _decode_fraction(decoder, value):
+    return fractions.Fraction(*value)
+
+
+def _decode_uuid(decoder, value):
+    return uuid.UUID(bytes=bytes(value))
+
+
+def _decode_ip(address_class, network_class, interface_class, length,
+               decoder, value):
+    if not isinstance(value, list):
+        return address_class(bytes(value))
+
+    if isinstance(value[0], int):
+        prefix, address = value
+        return network_class((bytes(address).ljust(length, b'\0'), prefix))
+
+    address, prefix = value
+    return interface_class((bytes(address), prefix))
+
+
+def _decode_string_reference(decoder, value):
+    if decoder._string_references is None:
+        raise ValueError('string reference outside of a namespace')
+    if value >= len(decoder._string_references):
+        raise ValueError('string reference %d is not defined' % value)
+    return decoder._string_references[value]
+
+
+def _decode_shared_reference(decoder, value):
+    if value >= len(decoder._shareables) or \
+            decoder._shareables[value] is None:
+        raise ValueError('shared value %d is not available' % value)
+    return decoder._shareables[value]
+
+
+def _decode_positive_bignum(decoder, value):
+    return int.from_bytes(value, 'big')
+
+
+def _decode_negative_bignum(decoder, value):
+    return -1 - int.from_bytes(value, 'big')
+
+
+def _decode_typed_array(tag, decoder, value):
+    kind, size, little = _TYPED_ARRAY_TAGS[tag]
+    if len(value) % size:
+        raise ValueError('typed array length is not a multiple of %d'
+                         % size)
+
+    if kind == 'f' and size == 16:
+        # There is no portable binary128 type, so leave the bytes alone
+        return value
+
+    if decoder._numpy:
+        import numpy
+        return numpy.frombuffer(
+            value, '%s%s%d' % ('<' if little else '>', kind, size))
+
+    if kind == 'f' and size == 2:
+        return array.array('f', struct.unpack(
+            '%s%de' % ('<' if little else '>', len(value) // 2), value))
+
+    result = array.array(_ARRAY_TYPECODES[kind, size])
+    result.frombytes(value)
+    if little != _NATIVE_LITTLE:
+        result.byteswap()
+    return result
+
+
+def _decode_multi_dim_array(column_major, decoder, value):
+    shape, elements = value
+    size = 1
+    for dim in shape:
+        size *= dim
+    if len(elements) != size:
+        raise ValueError('array has %d elements but its shape needs %d'
+                         % (len(elements), size))
+
+    order = 'F' if column_major else 'C'
+    if decoder._numpy:
+        import numpy
+        return numpy.asarray(elements).reshape(shape, order=order)
+
+    if column_major:
+        # Gather the elements into row-major order first
+        strides = []
+        stride = 1
+        for dim in shape:
+            strides.append(stride)
+            stride *= dim
+        elements = [elements[sum(i * s for i, s in zip(index, strides))]
+                    for index in itertools.product(
+                        *(range(dim) for dim in shape))]
+
+    return _nest(list(elements), shape)
+
+
+def _nest(elements, shape):
+    if len(shape) == 1:
+        return elements
+
+    step = len(elements) // shape[0] if shape[0] else 0
+    return [_nest(elements[i * step:(i + 1) * step], shape[1:])
+            for i in range(shape[0])]
+
+
+def _decode_embedded(decoder, value):
+    # Tag 24 holds a complete data item of its own, so it does not see the
+    # surrounding string references
+    references = decoder._string_references
+    node = decoder._raw_node
+    decoder._string_references = decoder._raw_node = None
+    try:
+        return decoder._decode_value(0, value)[1]
+    finally:
+        decoder._string_references = references
+        decoder._raw_node = node
+
+
+def _skip_value(data, offset, pending=None):
+    # Find the end of the data item at offset without decoding it. Also tell
+    # whether the item can be moved elsewhere on its own, which it cannot if
+    # it contains shared values or string references. The end is past the
+    # end of data if the item is cut short.
+    #
+    # A scan that runs out of data can be resumed once more has arrived. The
+    # caller then passes pending, the numbers of items still to skip, which
+    # is left non-empty if the item is cut short and the offset returned is
+    # where to continue.
+    self_contained = True
+    resumable = pending is not None
+    if not resumable:
+        pending = [1]
+    while pending:
+        count = pending[-1]
+        if count == 0:
+            pending.pop()
+            continue
+        if offset >= len(data):
+            break
+        if count is None and data[offset] == 0xFF:
             offset += 1
-            value = data[offset:offset + value_len]
-            offset += offset_inc + value_len - 1
+            pending.pop()
+            continue
 
-    if major_type == 3:
+        major_type = data[offset] >> 5
+        extra = data[offset] & 0x1f
         if extra == 31:
+            if not 2 <= major_type <= 5:
+                raise ValueError('unexpected break at offset %d' % offset)
+            if count is not None:
+                pending[-1] = count - 1
             offset += 1
-            value = ''
-            while data[offset] != 0xFF:
-                offset, item = _decode_value(offset, data)
-                value += item
-            offset += 1
+            pending.append(None)
+            continue
+
+        try:
+            offset_inc, length = _decode_int(extra, data, offset + 1)
+        except (IndexError, struct.error):
+            break
+        if count is not None:
+            pending[-1] = count - 1
+        offset += offset_inc
+        if major_type == 2 or major_type == 3:
+            offset += length
+        elif major_type == 4:
+            pending.append(length)
+        elif major_type == 5:
+            pending.append(2 * length)
+        elif major_type == 6:
+            if length in (25, 28, 29, 256):
+                self_contained = False
+            pending.append(1)
+
+    if pending and not resumable:
+        offset = max(offset, len(data) + 1)
+    return (offset, self_contained)
+
+
+# Marks the end of a path in the tree built by _path_tree
+_RAW = object()
+
+
+def _path_tree(paths):
+    # Nested dicts from each key or index along the paths to the next level.
+    # Ellipsis matches any key or index.
+    tree = {}
+    for path in paths:
+        if not path:
+            raise ValueError('raw paths must not be empty')
+        node = tree
+        for key in path[:-1]:
+            node = node.setdefault(key, {})
+            if node is _RAW:
+                break
         else:
-            offset_inc, value_len = _decode_int(extra, data[1 + offset:])
-            offset += 1
-            value = data[offset:offset + value_len].decode('utf8')
-            offset += offset_inc + value_len - 1
+            node[path[-1]] = _RAW
+    return _expand_wildcards(tree)
 
-    if major_type == 4:
-        value = []
-        if extra == 31:
-            offset += 1
-            while data[offset] != 0xFF:
-                offset, item = _decode_value(offset, data)
-                value.append(item)
-            offset += 1
+
+def _expand_wildcards(node):
+    # A specific key also has to follow the paths through Ellipsis next to
+    # it, since only one child is looked up for each key
+    if node is _RAW:
+        return node
+    wildcard = node.get(Ellipsis)
+    expanded = {}
+    for key, child in node.items():
+        if wildcard is not None and key is not Ellipsis:
+            child = _merge_paths(child, wildcard)
+        expanded[key] = _expand_wildcards(child)
+    return expanded
+
+
+def _merge_paths(node, other):
+    # The end of a path covers everything below it
+    if node is _RAW or other is _RAW:
+        return _RAW
+    merged = dict(node)
+    for key, child in other.items():
+        merged[key] = _merge_paths(merged[key], child) if key in merged \
+            else child
+    return merged
+
+
+# Functions which take a decoder and the decoded content of a tag and return
+# the value the tag represents
+_tag_decoders = {
+    0: _decode_datetime_string,
+    1: _decode_epoch_datetime,
+    2: _decode_positive_bignum,
+    3: _decode_negative_bignum,
+    4: _decode_decimal,
+    25: _decode_string_reference,
+    29: _decode_shared_reference,
+    30: _decode_fraction,
+    37: _decode_uuid,
+    52: functools.partial(_decode_ip, ipaddress.IPv4Address,
+                          ipaddress.IPv4Network, ipaddress.IPv4Interface, 4),
+    54: functools.partial(_decode_ip, ipaddress.IPv6Address,
+                          ipaddress.IPv6Network, ipaddress.IPv6Interface, 16),
+    40: functools.partial(_decode_multi_dim_array, False),
+    1040: functools.partial(_decode_multi_dim_array, True),
+}
+for _tag in _TYPED_ARRAY_TAGS:
+    _tag_decoders[_tag] = functools.partial(_decode_typed_array, _tag)
+
+
+def register_tag_decoder(tag, function):
+    _tag_decoders[tag] = function
+
+
+class Decoder:
+    def __init__(self, numpy=False, float_arrays=False, tag_decoders=None,
+                 key_cache_size=1024, object_hook=None, cls=None,
+                 array_type=list, map_type=dict, object_pairs_hook=None,
+                 raw_paths=None, decode_embedded=False, chunked_strings=False,
+                 max_container_length=None, max_string_length=None):
+        self._numpy = numpy
+        self._float_arrays = float_arrays
+        # Both key caches drop their least recently used entries when full.
+        # They are only built once they are first used, since decode()
+        # creates a decoder for every value.
+        self._key_cache_size = key_cache_size
+        self._key_cache = None
+        self._key_indexes = _key_index
+        if key_cache_size:
+            self._key_cache = self._start_key_cache
+            self._key_indexes = self._start_key_indexes
+
+        self._string_references = None
+        self._shareables = []
+        self._shareable_index = None
+
+        self._tag_decoders = _tag_decoders
+        if tag_decoders:
+            self._tag_decoders = dict(_tag_decoders)
+            self._tag_decoders.update(tag_decoders)
+
+        self._object_hook = object_hook
+        self._schema = None if cls is None else _class_schema(cls)
+
+        self._array_type = array_type
+        self._map_type = map_type
+        self._object_pairs_hook = object_pairs_hook
+
+        self._chunked_strings = chunked_strings
+        self._max_container_length = max_container_length \
+            if max_container_length is not None else sys.maxsize
+        self._max_string_length = max_string_length \
+            if max_string_length is not None else sys.maxsize
+
+        self._raw_paths = None if raw_paths is None else _path_tree(raw_paths)
+        self._raw_node = None
+        if decode_embedded:
+            self._tag_decoders = dict(self._tag_decoders)
+            self._tag_decoders[24] = _decode_embedded
+
+    def _start_key_cache(self, raw):
+        self._key_cache = functools.lru_cache(self._key_cache_size)(
+            _intern_key)
+        return self._key_cache(raw)
+
+    def _start_key_indexes(self, keys):
+        self._key_indexes = functools.lru_cache(self._key_cache_size)(
+            _key_index)
+        return self._key_indexes(keys)
+
+    def decode(self, data):
+        return self.decode_from(data)[0]
+
+    def decode_from(self, data, offset=0):
+        self._shareables = []
+        self._raw_node = self._raw_paths
+        if self._schema is not None:
+            offset, value = self._schema._decode_record(self, offset, data)
         else:
-            offset_inc, value_len = _decode_int(extra, data[1 + offset:])
+            offset, value = self._decode_value(offset, data)
+        return (value, offset)
+
+    def _decode_value(self, offset, data):
+        major_type = data[offset] >> 5
+        extra = data[offset] & 0x1f
+        value = None
+
+        if major_type == 0:
+            offset_inc, value = _decode_int(extra, data, offset + 1)
             offset += offset_inc
-            for i in range(0, value_len):
-                offset, item = _decode_value(offset, data)
-                value.append(item)
 
-    if major_type == 5:
-        value = {}
+        if major_type == 1:
+            offset_inc, value = _decode_int(extra, data, offset + 1)
+            offset += offset_inc
+            value = -1 - value
+
+        if major_type == 2:
+            if extra == 31:
+                offset, value = self._decode_chunks(offset + 1, data,
+                                                    major_type)
+            else:
+                offset_inc, value_len = _decode_int(extra, data, offset + 1)
+                offset += offset_inc
+                # Slicing a memoryview does not copy, so byte strings decoded
+                # from one refer directly to the underlying buffer
+                value = data[offset:offset + value_len]
+                if value_len > self._max_string_length or \
+                        len(value) != value_len:
+                    self._check_string(value_len, offset, data)
+                offset += value_len
+
+                if self._string_references is not None:
+                    self._add_string_reference(value, value_len)
+
+        if major_type == 3:
+            if extra == 31:
+                offset, value = self._decode_chunks(offset + 1, data,
+                                                    major_type)
+            else:
+                offset_inc, value_len = _decode_int(extra, data, offset + 1)
+                offset += offset_inc
+                value = data[offset:offset + value_len]
+                if value_len > self._max_string_length or \
+                        len(value) != value_len:
+                    self._check_string(value_len, offset, data)
+                value = str(value, 'utf8')
+                offset += value_len
+
+                if self._string_references is not None:
+                    self._add_string_reference(value, value_len)
+
+        if major_type == 4:
+            if self._raw_node is not None:
+                offset, value = self._decode_path_array(offset, data, extra)
+            elif extra == 31:
+                offset, value = self._decode_array(offset + 1, data, None)
+                offset += 1
+            else:
+                offset_inc, value_len = _decode_int(extra, data, offset + 1)
+                offset += offset_inc
+                if value_len > self._max_container_length or \
+                        value_len > len(data) - offset:
+                    self._check_container(value_len, offset, data, 1)
+                offset, value = self._decode_array(offset, data, value_len)
+
+            if self._array_type is not list and value.__class__ is list:
+                value = self._array_type(value)
+
+        if major_type == 5 and self._raw_node is not None:
+            offset, value = self._decode_path_map(offset, data, extra)
+
+        elif major_type == 5 and (self._object_pairs_hook is not None or
+                                  self._map_type is FrozenMap):
+            offset, value = self._decode_pairs(offset, data, extra)
+
+        elif major_type == 5:
+            value = {}
+            if self._shareable_index is not None:
+                self._share(value)
+
+            if extra == 31:
+                offset += 1
+                count = 0
+                while data[offset] != 0xFF:
+                    count += 1
+                    if count > self._max_container_length:
+                        self._check_container(count, offset, data, 0)
+                    offset, key = self._decode_key(offset, data)
+                    offset, item = self._decode_value(offset, data)
+                    value[key] = item
+                offset += 1
+            else:
+                offset_inc, value_len = _decode_int(extra, data, offset + 1)
+                offset += offset_inc
+                if value_len > self._max_container_length or \
+                        2 * value_len > len(data) - offset:
+                    self._check_container(value_len, offset, data, 2)
+                for i in range(0, value_len):
+                    offset, key = self._decode_key(offset, data)
+                    offset, item = self._decode_value(offset, data)
+                    value[key] = item
+
+            if self._object_hook is not None:
+                value = self._object_hook(value)
+            elif self._map_type is not dict:
+                value = self._map_type(value)
+
+        if major_type == 6:
+            offset_inc, tag = _decode_int(extra, data, offset + 1)
+            offset += offset_inc
+
+            if tag == 28:
+                # Containers are shared as soon as they are created so that
+                # items inside them can refer back to them
+                index = self._shareable_index = len(self._shareables)
+                self._shareables.append(None)
+                try:
+                    offset, value = self._decode_value(offset, data)
+                finally:
+                    self._shareable_index = None
+                self._shareables[index] = value
+            elif tag == 256:
+                # Strings inside the tagged value can refer to each other
+                references = self._string_references
+                self._string_references = []
+                try:
+                    offset, value = self._decode_value(offset, data)
+                finally:
+                    self._string_references = references
+            else:
+                offset, value = self._decode_value(offset, data)
+
+                tag_decoder = self._tag_decoders.get(tag)
+                if tag_decoder is None:
+                    value = Tag(tag, value)
+                else:
+                    value = tag_decoder(self, value)
+
+        simple = {
+            20: False,
+            21: True,
+            22: None,
+            23: None, # decode 'undefined' (23) as 'null' (22)
+        }
+
+        if major_type == 7:
+            offset += 1
+
+            if extra == 25:
+                # Half-precision
+                half = struct.unpack_from('>H', data, offset)[0]
+                value = _half_to_float(half)
+                offset += 2
+            elif extra == 26:
+                # Single-precision
+                value = struct.unpack_from('>f', data, offset)[0]
+                offset += 4
+            elif extra == 27:
+                value = struct.unpack_from('>d', data, offset)[0]
+                offset += 8
+            elif extra in simple:
+                value = simple[extra]
+            elif extra == 24:
+                value = int(data[offset])
+                offset += 1
+
+        return (offset, value)
+
+    def _decode_key(self, offset, data):
+        initial = data[offset]
+        if initial < 0x60 or initial > 0x77 or self._key_cache is None:
+            return self._decode_value(offset, data)
+
+        # Keys are usually short text strings repeated in every record, so
+        # look them up by their bytes and share a single interned str
+        start = offset + 1
+        offset = start + initial - 0x60
+        if initial - 0x60 > self._max_string_length:
+            self._check_string(initial - 0x60, start, data)
+        raw = data[start:offset]
+        if raw.__class__ is not bytes:
+            raw = bytes(raw)
+
+        if len(raw) != offset - start:
+            self._check_string(offset - start, start, data)
+        key = self._key_cache(raw)
+
+        if self._string_references is not None:
+            self._add_string_reference(key, offset - start)
+
+        return (offset, key)
+
+    def _decode_pairs(self, offset, data, extra):
+        # A shared map has to take its slot before any of its items can. A
+        # FrozenMap is created empty and filled in at the end so items can
+        # refer back to it. What a hook returns is only known at the end.
+        shared = None
+        if self._shareable_index is not None:
+            if self._object_pairs_hook is None:
+                shared = FrozenMap._from_index({}, ())
+            self._share(shared)
+
+        keys = []
+        values = []
         if extra == 31:
             offset += 1
             while data[offset] != 0xFF:
-                offset, key = _decode_value(offset, data)
-                offset, item = _decode_value(offset, data)
-                value[key] = item
+                if len(keys) >= self._max_container_length:
+                    self._check_container(len(keys) + 1, offset, data, 0)
+                offset, key = self._decode_key(offset, data)
+                offset, item = self._decode_value(offset, data)
+                keys.append(key)
+                values.append(item)
             offset += 1
         else:
-            offset_inc, value_len = _decode_int(extra, data[1 + offset:])
+            offset_inc, length = _decode_int(extra, data, offset + 1)
             offset += offset_inc
-            for i in range(0, value_len):
-                offset, key = _decode_value(offset, data)
-                offset, item = _decode_value(offset, data)
-                value[key] = item
-
-    simple = {
-        20: False,
-        21: True,
-        22: None,
-        23: None, # decode 'undefined' (23) as 'null' (22)
-    }
-
-    if major_type == 7:
+            self._check_container(length, offset, data, 2)
+            for i in range(length):
+                offset, key = self._decode_key(offset, data)
+                offset, item = self._decode_value(offset, data)
+                keys.append(key)
+                values.append(item)
+
+        if self._object_pairs_hook is not None:
+            return (offset, self._object_pairs_hook(list(zip(keys, values))))
+
+        # Maps with the same keys in the same order share one index
+        index = self._key_indexes(tuple(keys))
+
+        if shared is not None:
+            shared._index = index
+            shared._values = tuple(values)
+            return (offset, shared)
+        return (offset, FrozenMap._from_index(index, tuple(values)))
+
+    def _check_container(self, length, offset, data, item_size):
+        # Lengths are checked before anything is allocated for them. Each
+        # item takes at least one byte, so a length that goes past the end
+        # of the data cannot be right.
+        if length * item_size > len(data) - offset:
+            raise ValueError('container of %d items at offset %d is longer '
+                             'than the data' % (length, offset))
+        if length > self._max_container_length:
+            raise ValueError('container of %d items is longer than %d'
+                             % (length, self._max_container_length))
+
+    def _check_string(self, length, offset, data):
+        if length > len(data) - offset:
+            raise ValueError('string of %d bytes at offset %d is longer '
+                             'than the data' % (length, offset))
+        if length > self._max_string_length:
+            raise ValueError('string of %d bytes is longer than %d'
+                             % (length, self._max_string_length))
+
+    def _decode_chunks(self, offset, data, major_type):
+        # Collect the chunks and join them once at the end, which takes
+        # linear time unlike adding them up one by one. The chunks are read
+        # here directly since they are never string references themselves.
+        chunks = []
+        total = 0
+        while data[offset] != 0xFF:
+            initial = data[offset]
+            if initial >> 5 != major_type or initial & 0x1f == 31:
+                raise ValueError('invalid chunk at offset %d' % offset)
+            offset_inc, length = _decode_int(initial & 0x1f, data, offset + 1)
+            offset += offset_inc
+            self._check_string(length, offset, data)
+            total += length
+            if total > self._max_string_length:
+                raise ValueError('string of %d bytes is longer than %d'
+                                 % (total, self._max_string_length))
+            chunks.append(data[offset:offset + length])
+            offset += length
         offset += 1
 
-        if extra == 25:
-            # Half-precision
-            half = struct.unpack('>H', data[offset:offset + 2])[0]
-            value = _half_to_float(half)
-            offset += 2
-        elif extra == 26:
-            # Single-precision
-            value = struct.unpack('>f', data[offset:offset + 4])[0]
-            offset += 4
-        elif extra == 27:
-            value = struct.unpack('>d', data[offset:offset + 8])[0]
-            offset += 8
-        elif extra in simple:
-            value = simple[extra]
-        elif extra == 24:
-            value = int(data[offset])
-            offset += 1
+        if self._chunked_strings:
+            if major_type == 3:
+                chunks = [str(chunk, 'utf8') for chunk in chunks]
+            return (offset, chunks)
+
+        value = b''.join(chunks)
+        if major_type == 3:
+            value = str(value, 'utf8')
+        return (offset, value)
+
+    def _decode_path_item(self, offset, data, node, key):
+        child = node.get(key)
+        if child is None:
+            child = node.get(Ellipsis)
+
+        if child is _RAW:
+            # Values which take part in string references or sharing are
+            # decoded as usual since they only make sense in this message
+            end, self_contained = _skip_value(data, offset)
+            if end > len(data):
+                raise ValueError('truncated data item at offset %d' % offset)
+            if self_contained and self._string_references is None:
+                view = data if data.__class__ is memoryview \
+                    else memoryview(data)
+                return (end, Raw(view[offset:end]))
+            child = None
+
+        self._raw_node = child
+        try:
+            return self._decode_value(offset, data)
+        finally:
+            self._raw_node = None
+
+    def _decode_path_array(self, offset, data, extra):
+        # Arrays and maps along one of the raw paths are decoded item by item
+        # so that the items at the end of a path can be kept undecoded
+        node = self._raw_node
+        self._raw_node = None
+        value = []
+        if self._shareable_index is not None:
+            self._share(value)
+
+        try:
+            if extra == 31:
+                offset += 1
+                while data[offset] != 0xFF:
+                    if len(value) >= self._max_container_length:
+                        self._check_container(len(value) + 1, offset, data, 0)
+                    offset, item = self._decode_path_item(offset, data, node,
+                                                          len(value))
+                    value.append(item)
+                offset += 1
+            else:
+                offset_inc, length = _decode_int(extra, data, offset + 1)
+                offset += offset_inc
+                self._check_container(length, offset, data, 1)
+                for i in range(length):
+                    offset, item = self._decode_path_item(offset, data, node,
+                                                          i)
+                    value.append(item)
+        finally:
+            self._raw_node = node
+
+        return (offset, value)
+
+    def _decode_path_map(self, offset, data, extra):
+        node = self._raw_node
+        self._raw_node = None
+        value = {}
+        if self._shareable_index is not None:
+            self._share(value)
+
+        try:
+            if extra == 31:
+                offset += 1
+                count = 0
+                while data[offset] != 0xFF:
+                    count += 1
+                    if count > self._max_container_length:
+                        self._check_container(count, offset, data, 0)
+                    offset, key = self._decode_key(offset, data)
+                    offset, value[key] = self._decode_path_item(
+                        offset, data, node, key)
+                offset += 1
+            else:
+                offset_inc, length = _decode_int(extra, data, offset + 1)
+                offset += offset_inc
+                self._check_container(length, offset, data, 2)
+                for i in range(length):
+                    offset, key = self._decode_key(offset, data)
+                    offset, value[key] = self._decode_path_item(
+                        offset, data, node, key)
+        finally:
+            self._raw_node = node
+
+        if self._object_pairs_hook is not None:
+            value = self._object_pairs_hook(list(value.items()))
+        elif self._object_hook is not None:
+            value = self._object_hook(value)
+        elif self._map_type is not dict:
+            value = self._map_type(value)
+
+        return (offset, value)
+
+    def _share(self, value):
+        self._shareables[self._shareable_index] = value
+        self._shareable_index = None
+
+    def _add_string_reference(self, value, length):
+        references = self._string_references
+        if length >= _string_reference_min_length(len(references)):
+            references.append(value)
+
+    def _decode_array(self, offset, data, length):
+        # Items are decoded one at a time, except for runs of floats with the
+        # same width which are unpacked together
+        value = []
+        if self._shareable_index is not None:
+            self._share(value)
+
+        floats_only = True
+        while len(value) < length if length is not None \
+                else data[offset] != 0xFF:
+            if length is None and len(value) >= self._max_container_length:
+                self._check_container(len(value) + 1, offset, data, 0)
+
+            initial = data[offset]
+            if 0xf9 <= initial <= 0xfb:
+                # Only unpack a run if the next item is a float of the same
+                # width too, single floats are cheaper to decode directly
+                limit = (length if length is not None
+                         else self._max_container_length) - len(value)
+                following = offset + (3, 5, 9)[initial - 0xf9]
+                if following > len(data):
+                    raise ValueError('truncated float')
+                if limit > 1 and \
+                        following < len(data) and data[following] == initial:
+                    offset, floats = _decode_float_run(data, offset, initial,
+                                                       limit)
+                    if self._float_arrays and not value and \
+                            len(floats) == length:
+                        return (offset, floats)
+                    value.extend(floats)
+                else:
+                    offset, item = self._decode_value(offset, data)
+                    value.append(item)
+            else:
+                offset, item = self._decode_value(offset, data)
+                value.append(item)
+                floats_only = False
+
+        if self._float_arrays and floats_only and value:
+            value = array.array('d', value)
+
+        return (offset, value)
+
+
+class FrozenMap(Mapping):
+    # An immutable mapping stored as a tuple of values and a dict from keys
+    # to positions, which the decoder shares between maps with the same keys
+
+    __slots__ = ('_index', '_values')
+
+    def __init__(self, *args, **kwargs):
+        data = dict(*args, **kwargs)
+        self._index = dict(zip(data, range(len(data))))
+        self._values = tuple(data.values())
+
+    @classmethod
+    def _from_index(cls, index, values):
+        self = cls.__new__(cls)
+        self._index = index
+        self._values = values
+        return self
+
+    def __getitem__(self, key):
+        return self._values[self._index[key]]
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __hash__(self):
+        return hash(frozenset(self.items()))
+
+    def __repr__(self):
+        return 'FrozenMap(%r)' % dict(self.items())
+
+
+def decode(data, **options):
+    return decode_from(data, 0, **options)[0]
+
+
+def decode_from(data, offset=0, **options):
+    if options:
+        return Decoder(**options).decode_from(data, offset)
+
+    # Like encode_into, reuse a decoder per thread and take it while it is
+    # in use. Its key cache then also carries over from one call to the next.
+    decoder = getattr(_local, 'decoder', None) or Decoder()
+    _local.decoder = None
+    try:
+        return decoder.decode_from(data, offset)
+    finally:
+        decoder._shareables = []
+        _local.decoder = decoder
+
+
+def _slot_names(cls):
+    names = []
+    for base in reversed(cls.__mro__):
+        slots = base.__dict__.get('__slots__', ())
+        if isinstance(slots, str):
+            slots = (slots,)
+        for name in slots:
+            if name not in ('__dict__', '__weakref__') and name not in names:
+                names.append(name)
+    return names
+
+
+class Schema:
+    # Encodes and decodes maps which always have the same keys. The keys are
+    # encoded once up front and decoding checks them byte for byte, falling
+    # back to a regular decode if a record has a different layout.
+
+    def __init__(self, fields, cls=None):
+        if isinstance(fields, dict):
+            self.fields = tuple(fields)
+            types = tuple(fields.values())
+        else:
+            self.fields = tuple(fields)
+            types = (None,) * len(self.fields)
+
+        if not self.fields:
+            raise ValueError('a schema needs at least one field')
+
+        self.cls = cls
+        # Named tuples are written as arrays, so those are records as well
+        self._arrays = cls is not None and issubclass(cls, tuple) and \
+            hasattr(cls, '_fields')
+        self._checks = [(i, name, type_) for i, (name, type_)
+                        in enumerate(zip(self.fields, types))
+                        if type_ is not None]
+
+        header = _encode_int(len(self.fields), 5)
+        keys = [encode(name) for name in self.fields]
+        self._prefixes = [header + keys[0]] + keys[1:]
+        self._prefix_lengths = [(prefix, len(prefix))
+                                for prefix in self._prefixes]
+
+        if len(self.fields) == 1:
+            item = operator.itemgetter(self.fields[0])
+            attribute = operator.attrgetter(self.fields[0])
+            self._get_items = lambda record: (item(record),)
+            self._get_attributes = lambda record: (attribute(record),)
+        else:
+            self._get_items = operator.itemgetter(*self.fields)
+            self._get_attributes = operator.attrgetter(*self.fields)
+
+        if cls is None:
+            self._build = lambda values: dict(zip(self.fields, values))
+        else:
+            self._build = lambda values: cls(**dict(zip(self.fields, values)))
+
+    @classmethod
+    def for_class(cls, record_class):
+        if dataclasses.is_dataclass(record_class):
+            fields = [field.name for field in dataclasses.fields(record_class)]
+            init = [field.init for field in dataclasses.fields(record_class)]
+            if all(init):
+                build = lambda values: record_class(*values)
+            else:
+                # Fields left out of __init__ are set afterwards, even on
+                # frozen dataclasses
+                def build(values):
+                    record = record_class(**{
+                        name: value for name, value, in_init
+                        in zip(fields, values, init) if in_init})
+                    for name, value, in_init in zip(fields, values, init):
+                        if not in_init:
+                            object.__setattr__(record, name, value)
+                    return record
+        elif issubclass(record_class, tuple) and \
+                hasattr(record_class, '_fields'):
+            fields = record_class._fields
+            build = lambda values: record_class(*values)
+        else:
+            fields = _slot_names(record_class)
+            if not fields:
+                raise TypeError('%s has no dataclass fields or __slots__'
+                                % record_class.__name__)
+
+            # There is no way to know what __init__ expects, so fill in the
+            # slots of a new instance directly
+            def build(values):
+                record = record_class.__new__(record_class)
+                for name, value in zip(fields, values):
+                    setattr(record, name, value)
+                return record
+
+        schema = cls(fields, record_class)
+        schema._build = build
+        return schema
+
+    def _encode_record(self, encoder, record):
+        if isinstance(record, (dict, Mapping)):
+            values = self._get_items(record)
+        else:
+            try:
+                values = self._get_attributes(record)
+            except AttributeError as e:
+                raise TypeError('cannot encode %s: %s'
+                                % (record.__class__.__name__, e))
+
+        if encoder._canonical:
+            encoder._encode_sorted_map(dict(zip(self.fields, values)))
+            return
+
+        if encoder._string_references is not None:
+            # The keys have to be added to the namespace like any other
+            # string, so they cannot be written out pre-encoded
+            encoder._write(_encode_int(len(self.fields), 5))
+            for name, value in zip(self.fields, values):
+                encoder._encode_value(name)
+                encoder._encode_value(value)
+            return
+
+        for prefix, value in zip(self._prefixes, values):
+            encoder._write(prefix)
+            encoder._encode_value(value)
+
+    def encode(self, record, **options):
+        encoder = Encoder(**options)
+        self._encode_record(encoder, record)
+        return encoder.getvalue()
+
+    def encode_many(self, records, **options):
+        encoder = Encoder(**options)
+        encoder._write(_encode_int(len(records), 4))
+        for record in records:
+            self._encode_record(encoder, record)
+        return encoder.getvalue()
+
+    def _decode_record(self, decoder, offset, data):
+        start = offset
+        decode_value = decoder._decode_value
+        values = []
+        append = values.append
+        if isinstance(data, bytes):
+            # bytes can be compared in place, other buffers are sliced
+            matches = data.startswith
+            for prefix, length in self._prefix_lengths:
+                if not matches(prefix, offset):
+                    break
+                offset, value = decode_value(offset + length, data)
+                append(value)
+            else:
+                return (offset, self._finish(values))
+        else:
+            for prefix, length in self._prefix_lengths:
+                if data[offset:offset + length] != prefix:
+                    break
+                offset, value = decode_value(offset + length, data)
+                append(value)
+            else:
+                return (offset, self._finish(values))
+
+        # The keys are in a different order, encoded differently or there
+        # are extra ones, so decode the whole map and pick out the fields
+        offset, record = decoder._decode_value(start, data)
+        if self._arrays and isinstance(record, (list, tuple)) and \
+                len(record) == len(self.fields):
+            values = record
+        elif isinstance(record, (dict, Mapping)):
+            try:
+                values = self._get_items(record)
+            except KeyError as e:
+                raise ValueError('missing field %s' % e)
+        else:
+            raise ValueError('expected a map but got %r' % (record,))
+
+        return (offset, self._finish(values))
+
+    def _finish(self, values):
+        if self._checks:
+            for i, name, type_ in self._checks:
+                if not isinstance(values[i], type_):
+                    raise ValueError('field %r should be %s but is %r'
+                                     % (name, type_.__name__, values[i]))
+
+        return self._build(values)
+
+    def decode(self, data, **options):
+        return self.decode_from(data, 0, **options)[0]
+
+    def decode_from(self, data, offset=0, **options):
+        offset, record = self._decode_record(Decoder(**options), offset, data)
+        return (record, offset)
+
+    def decode_many(self, data, **options):
+        decoder = Decoder(**options)
+        if data[0] >> 5 != 4 or data[0] & 0x1f == 31:
+            raise ValueError('expected a definite-length array')
+
+        offset, length = _decode_int(data[0] & 0x1f, data, 1)
+        decoder._check_container(length, offset, data, 1)
+        records = []
+        for i in range(length):
+            offset, record = self._decode_record(decoder, offset, data)
+            records.append(record)
+        return records
+
 
-    return (offset, value)
+_class_schemas = {}
 
 
-def decode(data):
-    return _decode_value(0, data)[1]
+def _class_schema(cls):
+    # Working out the fields of a class is slow, so do it once per class
+    schema = _class_schemas.get(cls)
+    if schema is None:
+        schema = _class_schemas[cls] = Schema.for_class(cls)
+    return schema
@@ -0,0 +1,128 @@
+import struct
+
+import pycbor
+
+# Messages are either preceded by their length as a 32-bit big-endian
+# integer, or follow each other directly as a CBOR sequence (RFC 8742)
+LENGTH_PREFIXED = 'length'
+SEQUENCE = 'sequence'
+
+_LENGTH = struct.Struct('>I')
+
+
+def frame(data, framing=LENGTH_PREFIXED, **options):
+    encoded = pycbor.encode(data, **options)
+    if framing == SEQUENCE:
+        return encoded
+    if framing != LENGTH_PREFIXED:
+        raise ValueError('unknown framing %r' % (framing,))
+    if len(encoded) > 0xffffffff:
+        raise ValueError('message of %d bytes is too large to frame'
+                         % len(encoded))
+    return _LENGTH.pack(len(encoded)) + encoded
+
+
+def write_frame(fp, data, framing=LENGTH_PREFIXED, **options):
+    fp.write(frame(data, framing, **options))
+
+
+class FrameDecoder:
+    # Splits bytes received in pieces of any size into messages and decodes
+    # them. Messages larger than max_message_size are rejected before they
+    # are buffered completely, and the remaining options go to the Decoder.
+
+    def __init__(self, framing=LENGTH_PREFIXED, max_message_size=1 << 24,
+                 **options):
+        if framing not in (LENGTH_PREFIXED, SEQUENCE):
+            raise ValueError('unknown framing %r' % (framing,))
+
+        self._framing = framing
+        self._max_message_size = max_message_size
+        self._decoder = pycbor.Decoder(**options)
+        self._buffer = bytearray()
+        # How far the incomplete message at the start of the buffer has been
+        # scanned, and what was still left to skip there
+        self._scanned = 0
+        self._pending = None
+
+    def __len__(self):
+        # Number of bytes buffered that are not part of a complete message
+        return len(self._buffer)
+
+    def feed(self, data):
+        self._buffer += data
+        messages = []
+        pos = 0
+        try:
+            while True:
+                span = self._next_message(pos)
+                if span is None:
+                    break
+                start, end = span
+                message = bytes(self._buffer[start:end])
+                value, used = self._decoder.decode_from(message)
+                if used != len(message):
+                    raise ValueError('message has %d bytes of trailing data'
+                                     % (len(message) - used))
+                messages.append(value)
+                pos = end
+        finally:
+            del self._buffer[:pos]
+
+        return messages
+
+    def _next_message(self, pos):
+        buffer = self._buffer
+        available = len(buffer) - pos
+
+        if self._framing == LENGTH_PREFIXED:
+            if available < _LENGTH.size:
+                return None
+            size = _LENGTH.unpack_from(buffer, pos)[0]
+            self._check_size(size)
+            if available - _LENGTH.size < size:
+                return None
+            start = pos + _LENGTH.size
+            return (start, start + size)
+
+        if not available or available < self._scanned:
+            return None
+        pending = self._pending
+        if pending is None:
+            pending = [1]
+        end = pycbor._skip_value(buffer, pos + self._scanned, pending)[0]
+
+        if pending or end > len(buffer):
+            # The message is not complete yet. The next feed continues the
+            # scan from here, or once past the end of a string cut short.
+            self._check_size(end - pos)
+            self._scanned = end - pos
+            self._pending = pending
+            return None
+
+        self._scanned = 0
+        self._pending = None
+        self._check_size(end - pos)
+        return (pos, end)
+
+    def _check_size(self, size):
+        if size > self._max_message_size:
+            raise ValueError('message of %d bytes is larger than %d'
+                             % (size, self._max_message_size))
+
+
+def read_frames(fp, framing=LENGTH_PREFIXED, max_message_size=1 << 24,
+                read_size=1 << 16, **options):
+    # Decode messages from a file object, such as socket.makefile('rb'),
+    # until it is exhausted
+    decoder = FrameDecoder(framing, max_message_size, **options)
+    read = getattr(fp, 'read1', fp.read)
+    while True:
+        data = read(read_size)
+        if not data:
+            break
+        for message in decoder.feed(data):
+            yield message
+
+    if len(decoder):
+        raise ValueError('stream ended in the middle of a message')
@@ -0,0 +1,192 @@
+import queue
+import struct
+import time
+from multiprocessing import shared_memory
+
+import pycbor
+
+# The header holds the capacity of the data area followed by the write and
+# read counters. The counters only ever increase and are kept on separate
+# cache lines since each one is written by a different process.
+_CAPACITY_OFFSET = 0
+_HEAD_OFFSET = 64
+_TAIL_OFFSET = 128
+_HEADER_SIZE = 192
+
+_COUNTER = struct.Struct('<Q')
+_LENGTH = struct.Struct('<I')
+
+# Length value marking that the rest of the data area is unused and the next
+# message starts back at the beginning
+_WRAP = 0xffffffff
+
+_POLL_INTERVAL = 0.0005
+
+
+class RingBuffer:
+    # A single-producer, single-consumer queue of CBOR messages stored in
+    # shared memory. Byte strings returned by get() are memoryview slices of
+    # the shared memory and stay valid until the next call to get() or
+    # release().
+
+    def __init__(self, name=None, create=False, size=1 << 20):
+        if name is None:
+            create = True
+
+        if create:
+            self._shm = shared_memory.SharedMemory(name, True,
+                                                   _HEADER_SIZE + size)
+            _COUNTER.pack_into(self._shm.buf, _CAPACITY_OFFSET, size)
+            _COUNTER.pack_into(self._shm.buf, _HEAD_OFFSET, 0)
+            _COUNTER.pack_into(self._shm.buf, _TAIL_OFFSET, 0)
+        else:
+            self._shm = shared_memory.SharedMemory(name)
+
+        self._buf = self._shm.buf
+        self._capacity = _COUNTER.unpack_from(self._buf, _CAPACITY_OFFSET)[0]
+        self._data = self._buf[_HEADER_SIZE:_HEADER_SIZE + self._capacity]
+        self._encoder = pycbor.Encoder()
+        self._decoder = pycbor.Decoder()
+        self._pending = 0
+
+    def __reduce__(self):
+        # Attach to the same segment when sent to another process
+        return (self.__class__, (self.name,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    def _counter(self, offset):
+        return _COUNTER.unpack_from(self._buf, offset)[0]
+
+    def _wait(self, ready, block, timeout, exception):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not ready():
+            if not block or (deadline is not None and
+                             time.monotonic() >= deadline):
+                raise exception
+            time.sleep(_POLL_INTERVAL)
+
+    def put(self, data, block=True, timeout=None):
+        capacity = self._capacity
+        head = self._counter(_HEAD_OFFSET)
+        start = head % capacity
+        free = capacity - (head - self._counter(_TAIL_OFFSET))
+
+        # Skipping the end of the data area can waste up to one message worth
+        # of space, so only messages up to half the capacity always fit
+        largest = capacity // 2
+
+        # Messages are never split. Encode straight into the free space up to
+        # the end of the data area, and if the message does not fit there,
+        # skip to the start of the data area and try again.
+        skip = 0
+        size = self._encode_at(data, start, min(capacity, start + free,
+                                                start + largest))
+        if size is None and free > capacity - start:
+            skip = capacity - start
+            size = self._encode_at(data, 0, min(free - skip, largest))
+
+        if size is None:
+            # Not enough space is free yet. Encode the message on its own to
+            # find out how much it needs, wait for that and copy it over.
+            skip = 0
+            encoder = self._encoder
+            encoder.reset()
+            encoder.append(data)
+            size = len(encoder)
+            if _LENGTH.size + size > largest:
+                raise ValueError('message larger than half the ring buffer')
+            if capacity - start < _LENGTH.size + size:
+                skip = capacity - start
+
+            needed = skip + _LENGTH.size + size
+            self._wait(
+                lambda: capacity - (head - self._counter(_TAIL_OFFSET)) >=
+                needed, block, timeout, queue.Full)
+
+            offset = 0 if skip else start
+            _LENGTH.pack_into(self._data, offset, size)
+            with encoder.getbuffer() as encoded:
+                self._data[offset + _LENGTH.size:
+                           offset + _LENGTH.size + size] = encoded
+
+        if skip >= _LENGTH.size:
+            _LENGTH.pack_into(self._data, start, _WRAP)
+
+        # Publish the message only once it has been completely written
+        _COUNTER.pack_into(self._buf, _HEAD_OFFSET,
+                           head + skip + _LENGTH.size + size)
+
+    def _encode_at(self, data, start, end):
+        # Encode data after its length prefix at start, if it fits before end
+        if end - start <= _LENGTH.size:
+            return None
+        with self._data[:end] as target:
+            try:
+                stop = self._encoder.encode_into(data, target,
+                                                 start + _LENGTH.size)
+            except ValueError:
+                return None
+        size = stop - start - _LENGTH.size
+        _LENGTH.pack_into(self._data, start, size)
+        return size
+
+    def release(self):
+        # Let the producer reuse the space of the last message returned by
+        # get(). Any memoryviews decoded from it must no longer be used.
+        if self._pending:
+            tail = self._counter(_TAIL_OFFSET)
+            _COUNTER.pack_into(self._buf, _TAIL_OFFSET, tail + self._pending)
+            self._pending = 0
+
+    def get(self, block=True, timeout=None):
+        self.release()
+
+        capacity = self._capacity
+        tail = self._counter(_TAIL_OFFSET)
+        self._wait(lambda: self._counter(_HEAD_OFFSET) != tail,
+                   block, timeout, queue.Empty)
+
+        start = tail % capacity
+        skip = 0
+        if capacity - start < _LENGTH.size or \
+                _LENGTH.unpack_from(self._data, start)[0] == _WRAP:
+            skip = capacity - start
+            start = 0
+
+        # The message is released by the next call even if it fails to
+        # decode, so that one bad message does not block all that follow
+        size = _LENGTH.unpack_from(self._data, start)[0]
+        self._pending = skip + _LENGTH.size + size
+        start += _LENGTH.size
+        value, end = self._decoder.decode_from(self._data[:start + size],
+                                               start)
+
+        return value
+
+    def close(self):
+        self._pending = 0
+        self._data.release()
+        self._buf = None
+        try:
+            self._shm.close()
+        except BufferError:
+            # Byte strings returned by get() are still in use. Leave the
+            # mapping to them, so it is unmapped once the last one is gone.
+            self._shm._mmap = None
+            self._shm.close()
+
+    def unlink(self):
+        self._shm.unlink()
@@ -38,10 +38,6 @@ def get_diagnostics():
                 # Skip tests which can't be decoded as JSON
                 continue
 
-        # Skip tests with out of range ints
-        if (isinstance(diagnostic, int) and abs(diagnostic) >= (2 << 63) - 1):
-            continue
-
         # Get the expected bytestring
         encoded = encoded[2:]
         encoded = bytes((int(encoded[i] + encoded[i+1], 16) \
@@ -53,9 +49,5 @@ def get_diagnostics():
 
 
 def pytest_generate_tests(metafunc):
-    if all(x in metafunc.funcargnames for x in ('diagnostic', 'encoded')):
-        for diagnostic, encoded in get_diagnostics():
-            metafunc.addcall(funcargs={
-                'diagnostic': diagnostic,
-                'encoded': encoded
-            })
+    if all(x in metafunc.fixturenames for x in ('diagnostic', 'encoded')):
+        metafunc.parametrize(('diagnostic', 'encoded'), get_diagnostics())
@@ -0,0 +1,67 @@
+import array
+
+import pytest
+
+import pycbor
+
+ARRAYS = [
+    list(range(20)),
+    list(range(24, 200, 3)),
+    list(range(0, 100000, 997)),
+    list(range(-1, -100, -7)),
+    list(range(-5000, 5000, 311)),
+    [2 ** 40 + i for i in range(10)],
+    [i / 4 for i in range(20)],
+    [i / 3 for i in range(20)],
+    [0.1, 0.5, 1.5, 1e300, -0.0, float('inf'), 100000.0, 3.0, 1.0],
+    [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, float('nan')],
+    [1, 2, 3, 4, 5, 6, 7, 8, 9, True],
+    [1, 2, 3, 4, 5, 6, 7, 8, 9.0],
+]
+
+
+@pytest.mark.parametrize('data', ARRAYS)
+def test_bulk_matches_per_item(data):
+    assert pycbor.encode(data, bulk_arrays=True) == pycbor.encode(data)
+
+
+@pytest.mark.parametrize('data', ARRAYS)
+def test_bulk_matches_per_item_numpy(data):
+    pytest.importorskip('numpy')
+    assert pycbor.encode(data, bulk_arrays=True) == pycbor.encode(data)
+
+
+@pytest.mark.parametrize('data', [
+    [i / 4 for i in range(20)],
+    [i / 3 for i in range(20)],
+    [0.1, 0.5, 1.5, 1e300, -0.0, float('inf'), 100000.0, 3.0, 1.0],
+    [1.5, 2.5, 1, 'a', 0.1, 0.2],
+])
+def test_decode_float_runs(data):
+    assert pycbor.decode(pycbor.encode(data)) == data
+    assert pycbor.decode(memoryview(pycbor.encode(data))) == data
+    assert pycbor.decode(pycbor.encode(iter(data))) == data
+
+
+def test_decode_float_arrays():
+    data = [0.1, 0.5, 1.5, 1e300]
+    decoded = pycbor.decode(pycbor.encode(data), float_arrays=True)
+    assert decoded == array.array('d', data)
+    decoded = pycbor.decode(pycbor.encode(iter(data)), float_arrays=True)
+    assert decoded == array.array('d', data)
+    assert pycbor.decode(pycbor.encode([1.5, 1]), float_arrays=True) == \
+        [1.5, 1]
+
+
+def test_decode_truncated_float_run():
+    with pytest.raises(ValueError):
+        pycbor.decode(b'\x82\xf9\x3c\x00\xfb\x00')
+
+
+@pytest.mark.parametrize('run', [1, 2, 7, 8, 9, 24, 25, 1000])
+def test_decode_mixed_float_runs(run):
+    data = []
+    for i in range(5):
+        data += [i / 4] * run + [i, 0.1] + [1e300] * run + ['x']
+    assert pycbor.decode(pycbor.encode(data)) == data
+    assert pycbor.decode(pycbor.encode(iter(data))) == data
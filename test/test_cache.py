@@ -0,0 +1,83 @@
+import pycbor
+
+
+def test_cached_output_matches():
+    config = (('a' * 40, (1, 2.5)), frozenset([1]), b'x' * 40)
+    data = [{'config': config, 'name': 'n' * 40} for i in range(5)]
+    encoder = pycbor.Encoder(cache_size=16)
+    assert encoder.encode(data) == pycbor.encode(data)
+    assert encoder.encode(data) == pycbor.encode(data)
+    assert len(encoder._cache) > 0
+
+
+def test_equal_tuples_are_kept_apart():
+    encoder = pycbor.Encoder(cache_size=16)
+    assert encoder.encode([(1,), (1.0,), (True,)]) == \
+        b'\x83\x81\x01\x81\xf9\x3c\x00\x81\xf5'
+
+
+def test_eviction():
+    encoder = pycbor.Encoder(cache_size=2)
+    values = [('x' * 40, i) for i in range(5)]
+    encoder.encode(values)
+    assert len(encoder._cache) == 2
+
+    encoder = pycbor.Encoder(cache_size=100, cache_bytes=100)
+    encoder.encode(values)
+    assert encoder._cached_bytes <= 100
+    encoder.encode(('y' * 200,))
+    assert encoder._cached_bytes <= 100
+
+
+def test_references_bypass_cache():
+    data = [('abc' * 20,), ('abc' * 20,)]
+    encoder = pycbor.Encoder(cache_size=16, string_referencing=True)
+    assert encoder.encode(data) == \
+        pycbor.encode(data, string_referencing=True)
+    assert not encoder._cache
+
+
+def test_cache_with_chunks():
+    data = [tuple(range(100))] * 20
+    chunks = []
+    encoder = pycbor.Encoder(cache_size=4, chunk_size=64)
+    encoder.encode_to(data, lambda chunk: chunks.append(bytes(chunk)))
+    assert b''.join(chunks) == pycbor.encode(data)
+
+
+def test_raw():
+    encoded = pycbor.encode({'a': [1, 2]})
+    assert pycbor.encode([pycbor.Raw(encoded), 3]) == \
+        b'\x82' + encoded + b'\x03'
+    assert pycbor.encode(pycbor.Raw(memoryview(encoded))) == encoded
+    assert pycbor.Raw(encoded) == pycbor.Raw(memoryview(encoded))
+    assert hash(pycbor.Raw(b'\x01')) == hash(pycbor.Raw(bytearray(b'\x01')))
+
+
+def test_mutable_contents_are_not_cached():
+    items = [1]
+    value = ('x' * 40, items)
+    encoder = pycbor.Encoder(cache_size=16)
+    assert encoder.encode(value) == pycbor.encode(value)
+    items.append(2)
+    assert encoder.encode(value) == pycbor.encode(('x' * 40, [1, 2]))
+    assert all(entry[0] is not value for entry in encoder._cache.values())
+
+
+class Point:
+    __slots__ = ('x',)
+
+    def __init__(self, x):
+        self.x = x
+
+
+def test_changed_objects_are_not_cached():
+    point = Point(1)
+    value = ('x' * 40, point)
+    encoder = pycbor.Encoder(cache_size=16)
+    first = encoder.encode(value)
+    point.x = 2
+    assert encoder.encode(value) != first
+    assert encoder.encode(value) == pycbor.encode(value)
+    assert not encoder._cache or \
+        all(entry[0] is not value for entry in encoder._cache.values())
@@ -0,0 +1,77 @@
+import collections
+import dataclasses
+import os
+import subprocess
+import sys
+
+import pytest
+
+import pycbor
+
+
+def test_key_order():
+    # RFC 8949 section 4.2.1 sorts keys by their encoded bytes
+    data = {'aa': 1, 'b': 2, 10: 3, -1: 4, (1,): 5, False: 6, 100: 7}
+    assert pycbor.encode(data, canonical=True).hex() == \
+        'a70a03186407200461620262616101810105f406'
+
+
+def test_insertion_order_does_not_matter():
+    first = {'b': [1.5, {'y': 1, 'x': 2}], 'a': None}
+    second = collections.OrderedDict([('a', None),
+                                      ('b', [1.5, {'x': 2, 'y': 1}])])
+    assert pycbor.encode(first, canonical=True) == \
+        pycbor.encode(second, canonical=True)
+    assert pycbor.decode(pycbor.encode(first, canonical=True)) == first
+
+
+def test_definite_lengths():
+    assert pycbor.encode(iter([1, 2]), canonical=True) == b'\x82\x01\x02'
+
+
+def test_float_mode():
+    assert pycbor.encode(1.5, canonical=True) == b'\xf9\x3e\x00'
+    with pytest.raises(ValueError):
+        pycbor.Encoder(canonical=True, float_mode='double')
+
+
+@dataclasses.dataclass
+class Record:
+    name: str
+    id: int
+
+
+def test_objects():
+    assert pycbor.encode(Record('a', 1), canonical=True) == \
+        pycbor.encode({'id': 1, 'name': 'a'}, canonical=True)
+
+
+def test_string_references():
+    data = [{'bbb': 1, 'aaaa': 2}, {'aaaa': 3, 'bbb': 4}]
+    reordered = [dict(reversed(record.items())) for record in data]
+    encoded = pycbor.encode(data, canonical=True, string_referencing=True)
+    assert encoded == pycbor.encode(reordered, canonical=True,
+                                    string_referencing=True)
+    assert pycbor.decode(encoded) == data
+
+
+def test_sets():
+    assert pycbor.encode({'b', 'a', 'cc', 1}, canonical=True) == \
+        b'\x84\x01\x61a\x61b\x62cc'
+    assert pycbor.encode(frozenset([3, 1, 2]), canonical=True) == \
+        b'\x83\x01\x02\x03'
+    data = [{'xyz', 'abc'}, 'abc']
+    encoded = pycbor.encode(data, canonical=True, string_referencing=True)
+    assert pycbor.decode(encoded) == [['abc', 'xyz'], 'abc']
+
+
+def test_sets_across_hash_seeds():
+    code = ('import sys, pycbor; sys.stdout.write(pycbor.encode('
+            '{"%s" % i for i in range(50)}, canonical=True).hex())')
+    outputs = set()
+    for seed in ('1', '2', '3'):
+        environment = dict(os.environ, PYTHONHASHSEED=seed,
+                           PYTHONPATH=os.pathsep.join(sys.path))
+        outputs.add(subprocess.check_output([sys.executable, '-c', code],
+                                            env=environment))
+    assert len(outputs) == 1
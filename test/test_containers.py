@@ -0,0 +1,74 @@
+import collections
+
+import pytest
+
+import pycbor
+
+
+def test_array_type():
+    encoded = pycbor.encode([1, [2, 3], [1.5, 2.5]])
+    assert pycbor.decode(encoded, array_type=tuple) == (1, (2, 3), (1.5, 2.5))
+    assert pycbor.decode(b'\x9f\x01\xff', array_type=tuple) == (1,)
+
+
+def test_tuple_keys():
+    assert pycbor.decode(b'\xa1\x82\x01\x02\x00', array_type=tuple) == \
+        {(1, 2): 0}
+
+
+def test_object_pairs_hook():
+    encoded = pycbor.encode({'b': 1, 'a': {'c': 2}})
+    assert pycbor.decode(encoded, object_pairs_hook=list) == \
+        [('b', 1), ('a', [('c', 2)])]
+    assert pycbor.decode(b'\xbf\x01\x02\xff', object_pairs_hook=list) == \
+        [(1, 2)]
+
+
+def test_map_type():
+    encoded = pycbor.encode({'b': 1})
+    decoded = pycbor.decode(encoded, map_type=collections.OrderedDict)
+    assert decoded.__class__ is collections.OrderedDict
+
+
+def test_frozen_map():
+    records = [{'id': i, 'name': str(i)} for i in range(3)]
+    decoded = pycbor.decode(pycbor.encode(records),
+                            map_type=pycbor.FrozenMap)
+    assert decoded == records
+    assert decoded[0]._index is decoded[2]._index
+    assert decoded[1]['name'] == '1'
+    assert list(decoded[1].items()) == [('id', 1), ('name', '1')]
+    assert pycbor.encode(decoded) == pycbor.encode(records)
+    with pytest.raises(TypeError):
+        decoded[0]['id'] = 5
+
+
+def test_frozen_map_constructor():
+    value = pycbor.FrozenMap({'a': 1}, b=2)
+    assert value == {'a': 1, 'b': 2}
+    assert len(value) == 2 and 'b' in value and 'c' not in value
+    assert hash(value) == hash(pycbor.FrozenMap(b=2, a=1))
+    assert pycbor.decode(pycbor.encode(value)) == {'a': 1, 'b': 2}
+
+
+def test_shared_frozen_map():
+    shared = {'a': [1]}
+    decoded = pycbor.decode(pycbor.encode([shared, shared, [1]],
+                                          value_sharing=True),
+                            map_type=pycbor.FrozenMap)
+    assert decoded[0] is decoded[1]
+    assert decoded[0]['a'] == [1]
+
+    # The map, not its first nested container, owns the shareable slot
+    encoded = b'\xd8\x1c\xa2\x61x\x81\x01\x61y\xd8\x1d\x00'
+    decoded = pycbor.decode(encoded, map_type=pycbor.FrozenMap)
+    assert decoded['x'] == [1]
+    assert decoded['y'] is decoded
+
+
+def test_shared_array_type():
+    shared = [1, [2]]
+    decoded = pycbor.decode(pycbor.encode([shared, shared], value_sharing=True),
+                            array_type=tuple)
+    assert decoded == ((1, (2,)), (1, (2,)))
+    assert decoded[0] is decoded[1]
@@ -0,0 +1,110 @@
+import pytest
+
+import pycbor
+
+
+def test_map_keys_are_shared():
+    data = [{'identifier': i, 'ü': i} for i in range(3)]
+    for encoded in (pycbor.encode(data), memoryview(pycbor.encode(data))):
+        decoded = pycbor.decode(encoded)
+        assert decoded == data
+        keys = [list(record) for record in decoded]
+        assert keys[0][0] is keys[1][0] is keys[2][0]
+        assert keys[0][1] is keys[1][1] is keys[2][1]
+
+
+def test_key_cache_disabled():
+    data = [{'identifier': i} for i in range(3)]
+    assert pycbor.decode(pycbor.encode(data), key_cache_size=0) == data
+
+
+def test_key_cache_is_bounded():
+    decoder = pycbor.Decoder(key_cache_size=2)
+    data = {'k%d' % i: i for i in range(10)}
+    assert decoder.decode(pycbor.encode(data)) == data
+    assert decoder._key_cache.cache_info().currsize == 2
+
+
+def test_key_cache_evicts_least_recently_used():
+    decoder = pycbor.Decoder(key_cache_size=2)
+    decoder.decode(pycbor.encode({'aa': 1, 'bb': 2}))
+    decoder.decode(pycbor.encode({'aa': 1, 'cc': 3}))
+
+    # 'bb' was evicted to make room; 'aa' and 'cc' are still cached
+    hits = decoder._key_cache.cache_info().hits
+    assert decoder.decode(pycbor.encode({'aa': 1, 'cc': 3})) == \
+        {'aa': 1, 'cc': 3}
+    assert decoder._key_cache.cache_info().hits == hits + 2
+    misses = decoder._key_cache.cache_info().misses
+    assert decoder.decode(pycbor.encode({'bb': 2})) == {'bb': 2}
+    assert decoder._key_cache.cache_info().misses == misses + 1
+
+    data = [{'k%d' % i: i} for i in range(10)]
+    assert decoder.decode(pycbor.encode(data)) == data
+    keys = [next(iter(record)) for record in
+            decoder.decode(pycbor.encode(data))]
+    assert keys[9] is next(iter(decoder.decode(pycbor.encode(data[9]))))
+
+
+def test_lengths_past_the_end():
+    for encoded in (b'\x9b\xff\xff\xff\xff\xff\xff\xff\xff',
+                    b'\xbb\x00\x00\x00\x01\x00\x00\x00\x00\x01',
+                    b'\x5b\x00\x00\x01\x00\x00\x00\x00\x00ab',
+                    b'\x63ab', b'\xa1\x63ab', b'\x5f\x44ab\xff'):
+        with pytest.raises(ValueError):
+            pycbor.decode(encoded)
+
+
+def test_length_limits():
+    encoded = pycbor.encode({'a': [1, 2, 3], 'b': 'xyz', 'c': b'xyz'})
+    assert pycbor.decode(encoded, max_container_length=3,
+                         max_string_length=3)
+    with pytest.raises(ValueError):
+        pycbor.decode(encoded, max_container_length=2)
+    with pytest.raises(ValueError):
+        pycbor.decode(encoded, max_string_length=2)
+    with pytest.raises(ValueError):
+        pycbor.decode(encoded, max_string_length=2, map_type=pycbor.FrozenMap)
+
+
+def test_indefinite_length_limits():
+    array = b'\x9f' + b'\x01' * 1000 + b'\xff'
+    floats = b'\x9f' + b'\xf9\x3c\x00' * 1000 + b'\xff'
+    pairs = b'\xbf' + b'\x01\x02' * 1000 + b'\xff'
+    for encoded in (array, floats, pairs):
+        assert pycbor.decode(encoded, max_container_length=1000)
+        with pytest.raises(ValueError):
+            pycbor.decode(encoded, max_container_length=10)
+    with pytest.raises(ValueError):
+        pycbor.decode(pairs, max_container_length=10,
+                      map_type=pycbor.FrozenMap)
+    for encoded in (array, pairs):
+        with pytest.raises(ValueError):
+            pycbor.decode(encoded, max_container_length=10,
+                          raw_paths=[(5000,)])
+
+
+def test_indefinite_string_limit():
+    chunks = b'\x5f' + b'\x45abcde' * 1000 + b'\xff'
+    assert len(pycbor.decode(chunks, max_string_length=5000)) == 5000
+    with pytest.raises(ValueError):
+        pycbor.decode(chunks, max_string_length=10)
+
+
+def test_key_string_limit():
+    encoded = pycbor.encode({'abcdefghij': 1})
+    with pytest.raises(ValueError):
+        pycbor.decode(encoded, max_string_length=3)
+    decoder = pycbor.Decoder(max_string_length=3)
+    decoder._key_cache(b'abcdefghij')
+    with pytest.raises(ValueError):
+        decoder.decode(encoded)
+
+
+def test_decode_after_error():
+    # decode() reuses one decoder, which must not keep state from a failure
+    with pytest.raises(IndexError):
+        pycbor.decode(b'\xd9\x01\x00\xd8\x1c\x82\x61a')
+    assert pycbor.decode(b'\x82\xd8\x1c\x81\x01\xd8\x1d\x00') == [[1], [1]]
+    with pytest.raises(ValueError):
+        pycbor.decode(b'\x81\xd8\x1d\x00')
@@ -0,0 +1,80 @@
+import pytest
+
+import pycbor
+
+
+def test_encode_into_bytearray():
+    buffer = bytearray(8)
+    end = pycbor.encode_into([1, 2, 3], buffer, 2)
+    assert end == 6
+    assert buffer == b'\x00\x00\x83\x01\x02\x03\x00\x00'
+
+
+def test_encode_into_memoryview():
+    buffer = bytearray(4)
+    end = pycbor.encode_into('a', memoryview(buffer))
+    assert end == 2
+    assert buffer[:end] == b'\x61a'
+
+
+def test_encode_into_too_small():
+    buffer = bytearray(2)
+    with pytest.raises(ValueError):
+        pycbor.encode_into([1, 2, 3], buffer)
+    # The encoder can be used again after running out of space
+    assert pycbor.encode_into(1, buffer) == 1
+    with pytest.raises(ValueError):
+        pycbor.encode_into(1, buffer, 3)
+
+
+def test_encode_into_writes_in_place():
+    encoder = pycbor.Encoder()
+    buffer = bytearray(16)
+    assert encoder.encode_into({'b': 1, 'a': [1.5]}, buffer) == 10
+    assert len(encoder._buffer) == 0
+    assert buffer[:10] == pycbor.encode({'b': 1, 'a': [1.5]})
+
+    encoder = pycbor.Encoder(canonical=True)
+    assert encoder.encode_into({'b': 1, 'a': 2}, buffer) == 7
+    assert buffer[:7] == b'\xa2\x61a\x02\x61b\x01'
+
+
+def test_encode_into_nested():
+    def encode_point(encoder, value):
+        buffer = bytearray(8)
+        end = pycbor.encode_into(value.real, buffer)
+        return pycbor.Raw(bytes(buffer[:end]))
+
+    buffer = bytearray(8)
+    end = pycbor.encode_into([complex(1, 2)], buffer,
+                             encoders={complex: encode_point})
+    assert buffer[:end] == b'\x81\xf9\x3c\x00'
+
+
+def test_encoder_reuse():
+    encoder = pycbor.Encoder()
+    assert encoder.encode([1, 2, 3, 4, 5]) == b'\x85\x01\x02\x03\x04\x05'
+    assert encoder.encode(1) == b'\x01'
+    encoder.reset()
+    assert encoder.getvalue() == b''
+
+
+def test_encode_unicode_length():
+    assert pycbor.encode('ü') == b'\x62\xc3\xbc'
+
+
+def test_encode_reuses_encoder():
+    class Items(list):
+        pass
+
+    def encode_point(encoder, value):
+        return pycbor.Raw(pycbor.encode([value.real, value.imag]))
+
+    assert pycbor.encode(Items([1, 2])) == b'\x82\x01\x02'
+    assert pycbor.encode([complex(1, 2)], encoders={complex: encode_point}) \
+        == b'\x81\x82\xf9\x3c\x00\xf9\x40\x00'
+
+    # The reused encoder does not hold on to the buffer of a large value
+    assert len(pycbor.encode(b'x' * 100000)) == 100005
+    assert len(pycbor._local.encoder._buffer) < 100000
+    assert pycbor.encode(1) == b'\x01'
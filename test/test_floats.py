@@ -0,0 +1,64 @@
+import math
+import struct
+
+import pytest
+
+import pycbor
+
+
+@pytest.mark.parametrize('value, encoded', [
+    (2.0 ** -24, b'\xf9\x00\x01'),
+    (-2.0 ** -24, b'\xf9\x80\x01'),
+    (2.0 ** -20, b'\xf9\x00\x10'),
+    (2.0 ** -14 - 2.0 ** -24, b'\xf9\x03\xff'),
+    (2.0 ** -25, b'\xfa\x33\x00\x00\x00'),
+    (2.0 ** -30, b'\xfa\x30\x80\x00\x00'),
+    (2.0 ** -149, b'\xfa\x00\x00\x00\x01'),
+    (2.0 ** -150, b'\xfb\x36\x90\x00\x00\x00\x00\x00\x00'),
+    (65504.0, b'\xf9\x7b\xff'),
+    (65505.0, b'\xfa\x47\x7f\xe1\x00'),
+    (65520.0, b'\xfa\x47\x7f\xf0\x00'),
+    (1.0 + 2.0 ** -11, b'\xfa\x3f\x80\x10\x00'),
+    (3.4028234663852886e+38, b'\xfa\x7f\x7f\xff\xff'),
+    (3.4028235677973366e+38, b'\xfb\x47\xef\xff\xff\xf0\x00\x00\x00'),
+    (-float('nan'), b'\xf9\x7e\x00'),
+])
+def test_encode_float_edge_cases(value, encoded):
+    assert pycbor.encode(value) == encoded
+    decoded = pycbor.decode(encoded)
+    if math.isnan(value):
+        assert math.isnan(decoded)
+    else:
+        assert decoded == value
+
+
+def test_half_to_float_all_values():
+    for half in range(0, 65536, 7):
+        expected = struct.unpack('>e', struct.pack('>H', half))[0]
+        decoded = pycbor.decode(b'\xf9' + struct.pack('>H', half))
+        assert decoded == expected or math.isnan(expected)
+
+
+@pytest.mark.parametrize('value, single, double', [
+    (1.5, b'\xfa\x3f\xc0\x00\x00', b'\xfb\x3f\xf8\x00\x00\x00\x00\x00\x00'),
+    (0.1, b'\xfa\x3d\xcc\xcc\xcd', b'\xfb\x3f\xb9\x99\x99\x99\x99\x99\x9a'),
+    (float('inf'), b'\xfa\x7f\x80\x00\x00',
+     b'\xfb\x7f\xf0\x00\x00\x00\x00\x00\x00'),
+])
+def test_float_mode(value, single, double):
+    assert pycbor.encode(value, float_mode='single') == single
+    assert pycbor.encode(value, float_mode='double') == double
+    assert pycbor.encode([value] * 10, float_mode='double',
+                         bulk_arrays=True) == b'\x8a' + double * 10
+    assert pycbor.encode([value] * 10, float_mode='single',
+                         bulk_arrays=True) == b'\x8a' + single * 10
+
+
+def test_float_mode_single_overflow():
+    with pytest.raises(OverflowError):
+        pycbor.encode(1e300, float_mode='single')
+
+
+def test_unknown_float_mode():
+    with pytest.raises(ValueError):
+        pycbor.Encoder(float_mode='quad')
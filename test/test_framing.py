@@ -0,0 +1,75 @@
+import io
+
+import pytest
+
+import pycbor
+from pycbor import framing
+
+MESSAGES = [{'id': i, 'data': 'x' * i} for i in range(40)] + [b'y' * 100000]
+
+
+@pytest.mark.parametrize('kind', [framing.LENGTH_PREFIXED, framing.SEQUENCE])
+def test_feed_in_pieces(kind):
+    stream = b''.join(framing.frame(message, kind) for message in MESSAGES)
+    decoder = framing.FrameDecoder(kind)
+    decoded = []
+    for i in range(0, len(stream), 7):
+        decoded += decoder.feed(stream[i:i + 7])
+    assert decoded == MESSAGES
+    assert len(decoder) == 0
+
+
+@pytest.mark.parametrize('kind', [framing.LENGTH_PREFIXED, framing.SEQUENCE])
+def test_read_frames(kind):
+    fp = io.BytesIO()
+    for message in MESSAGES:
+        framing.write_frame(fp, message, kind)
+    fp.seek(0)
+    assert list(framing.read_frames(fp, kind, read_size=1000)) == MESSAGES
+
+    truncated = io.BytesIO(fp.getvalue()[:-1])
+    with pytest.raises(ValueError):
+        list(framing.read_frames(truncated, kind))
+
+
+def test_length_prefix():
+    assert framing.frame([1, 2]) == b'\x00\x00\x00\x03\x82\x01\x02'
+
+
+def test_max_message_size():
+    decoder = framing.FrameDecoder(max_message_size=100)
+    with pytest.raises(ValueError):
+        decoder.feed(b'\xff\xff\xff\xff')
+
+    decoder = framing.FrameDecoder(framing.SEQUENCE, max_message_size=100)
+    with pytest.raises(ValueError):
+        decoder.feed(b'\x5a\x00\x01\x00\x00')
+    decoder = framing.FrameDecoder(framing.SEQUENCE, max_message_size=10)
+    with pytest.raises(ValueError):
+        decoder.feed(b'\x9f' + b'\x01' * 20)
+
+
+def test_trailing_data():
+    with pytest.raises(ValueError):
+        framing.FrameDecoder().feed(b'\x00\x00\x00\x02\x01\x02')
+
+
+def test_decoder_options():
+    decoder = framing.FrameDecoder(array_type=tuple, max_container_length=2)
+    assert decoder.feed(framing.frame([1, 2])) == [(1, 2)]
+    with pytest.raises(ValueError):
+        decoder.feed(framing.frame([1, 2, 3]))
+
+
+def test_large_sequence_message_in_pieces():
+    # The scan of an incomplete message resumes where the last feed left it
+    message = [[i, 'x' * (i % 50), {'k': [i]}] for i in range(5000)]
+    stream = framing.frame(message, framing.SEQUENCE) + b'\x01'
+    decoder = framing.FrameDecoder(framing.SEQUENCE)
+    decoded = []
+    for i in range(0, len(stream), 16):
+        decoded += decoder.feed(stream[i:i + 16])
+        if i + 16 < len(stream) - 1:
+            assert decoder._scanned > i - 64
+    assert decoded == [message, 1]
+    assert len(decoder) == 0
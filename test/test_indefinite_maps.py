@@ -0,0 +1,29 @@
+import pycbor
+
+
+def test_indefinite_map():
+    pairs = ((str(i), i) for i in range(3))
+    encoded = pycbor.encode(pycbor.IndefiniteMap(pairs))
+    assert encoded == b'\xbf\x610\x00\x611\x01\x612\x02\xff'
+    assert pycbor.decode(encoded) == {'0': 0, '1': 1, '2': 2}
+
+
+def test_nested():
+    inner = pycbor.IndefiniteMap(iter([('x', [1, 2])]))
+    encoded = pycbor.encode([pycbor.IndefiniteMap([('a', inner)])])
+    assert pycbor.decode(encoded) == [{'a': {'x': [1, 2]}}]
+
+
+def test_items_view():
+    data = {'a': 1, 'b': [2]}
+    assert pycbor.encode(data.items()) == pycbor.encode(data)
+    assert pycbor.encode(pycbor.FrozenMap(data).items()) == \
+        pycbor.encode(data)
+
+
+def test_canonical():
+    pairs = [('b', 1), ('a', 2)]
+    assert pycbor.encode(pycbor.IndefiniteMap(pairs), canonical=True) == \
+        pycbor.encode({'a': 2, 'b': 1}, canonical=True)
+    assert pycbor.encode(dict(pairs).items(), canonical=True) == \
+        pycbor.encode({'a': 2, 'b': 1}, canonical=True)
@@ -0,0 +1,35 @@
+import pytest
+
+import pycbor
+
+
+@pytest.mark.parametrize('value, encoded', [
+    (255, b'\x18\xff'),
+    (256, b'\x19\x01\x00'),
+    (65535, b'\x19\xff\xff'),
+    (65536, b'\x1a\x00\x01\x00\x00'),
+    (4294967295, b'\x1a\xff\xff\xff\xff'),
+    (4294967296, b'\x1b\x00\x00\x00\x01\x00\x00\x00\x00'),
+    (18446744073709551615, b'\x1b\xff\xff\xff\xff\xff\xff\xff\xff'),
+    (-256, b'\x38\xff'),
+    (-18446744073709551616, b'\x3b\xff\xff\xff\xff\xff\xff\xff\xff'),
+    (18446744073709551616, b'\xc2\x49\x01\x00\x00\x00\x00\x00\x00\x00\x00'),
+    (-18446744073709551617,
+     b'\xc3\x49\x01\x00\x00\x00\x00\x00\x00\x00\x00'),
+])
+def test_int_boundaries(value, encoded):
+    assert pycbor.encode(value) == encoded
+    assert pycbor.decode(encoded) == value
+
+
+@pytest.mark.parametrize('bits', [65, 256, 2048, 4096])
+def test_bignum_round_trip(bits):
+    value = (1 << bits) - 12345
+    assert pycbor.decode(pycbor.encode(value)) == value
+    assert pycbor.decode(pycbor.encode(-value)) == -value
+    assert pycbor.decode(memoryview(pycbor.encode([value]))) == [value]
+
+
+def test_bulk_ints_with_bignum():
+    data = list(range(10)) + [1 << 70]
+    assert pycbor.encode(data, bulk_arrays=True) == pycbor.encode(data)
@@ -0,0 +1,101 @@
+import collections
+import dataclasses
+import pathlib
+
+import pytest
+
+import pycbor
+
+
+@dataclasses.dataclass
+class Point:
+    x: int
+    y: int
+
+
+@dataclasses.dataclass(frozen=True)
+class Line:
+    start: Point
+    end: Point
+
+
+Pair = collections.namedtuple('Pair', 'left right')
+
+
+class Slotted:
+    __slots__ = ('a', 'b')
+
+    def __init__(self, a, b):
+        self.a = a
+        self.b = b
+
+
+class Derived(Slotted):
+    __slots__ = 'c'
+
+
+def test_dataclass():
+    assert pycbor.encode(Point(1, 2)) == pycbor.encode({'x': 1, 'y': 2})
+    line = Line(Point(1, 2), Point(3, 4))
+    assert pycbor.encode([line]) == pycbor.encode(
+        [{'start': {'x': 1, 'y': 2}, 'end': {'x': 3, 'y': 4}}])
+
+
+def test_named_tuple():
+    assert pycbor.encode(Pair(1, 2)) == pycbor.encode([1, 2])
+    assert pycbor.decode(pycbor.encode(Pair(1, 2)), cls=Pair) == Pair(1, 2)
+
+
+def test_slots():
+    derived = Derived(1, 2)
+    derived.c = 3
+    assert pycbor.encode(derived) == pycbor.encode({'a': 1, 'b': 2, 'c': 3})
+    decoded = pycbor.decode(pycbor.encode(derived), cls=Derived)
+    assert (decoded.a, decoded.b, decoded.c) == (1, 2, 3)
+
+
+def test_unsupported_object():
+    with pytest.raises(TypeError):
+        pycbor.encode(object())
+    with pytest.raises(TypeError):
+        pycbor.encode(pathlib.PurePosixPath('/x'))
+
+
+def test_unset_slot():
+    value = Derived(1, 2)
+    with pytest.raises(TypeError):
+        pycbor.encode(value)
+
+
+@dataclasses.dataclass(frozen=True)
+class Computed:
+    x: int
+    double: int = dataclasses.field(init=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, 'double', self.x * 2)
+
+
+def test_fields_outside_init():
+    assert pycbor.encode(Computed(1)) == pycbor.encode({'x': 1, 'double': 2})
+    decoded = pycbor.decode(pycbor.encode({'x': 1, 'double': 5}),
+                            cls=Computed)
+    assert (decoded.x, decoded.double) == (1, 5)
+
+
+def test_typed_decode():
+    encoded = pycbor.encode(Point(1, 2))
+    assert pycbor.decode(encoded, cls=Point) == Point(1, 2)
+    assert pycbor.decode_from(b'\x00' + encoded, 1, cls=Point) == \
+        (Point(1, 2), len(encoded) + 1)
+
+
+def test_object_hook():
+    def hook(value):
+        if value.keys() == {'x', 'y'}:
+            return Point(**value)
+        return value
+
+    line = Line(Point(1, 2), Point(3, 4))
+    decoded = pycbor.decode(pycbor.encode(line), object_hook=hook)
+    assert decoded == {'start': Point(1, 2), 'end': Point(3, 4)}
@@ -0,0 +1,80 @@
+import pytest
+
+import pycbor
+
+MESSAGE = pycbor.encode({
+    'route': 'a',
+    'payload': {'x': [1, 2.5, {'y': b'z'}]},
+    'items': [{'body': [1]}, {'body': 'text'}, {'other': 1}],
+})
+
+
+def test_raw_paths():
+    decoded = pycbor.decode(MESSAGE,
+                            raw_paths=[('payload',), ('items', ..., 'body')])
+    assert decoded['route'] == 'a'
+    assert decoded['payload'] == pycbor.Raw(
+        pycbor.encode({'x': [1, 2.5, {'y': b'z'}]}))
+    assert isinstance(decoded['payload'].data, memoryview)
+    assert decoded['items'][1]['body'] == pycbor.Raw(b'\x64text')
+    assert decoded['items'][2] == {'other': 1}
+    assert pycbor.encode(decoded) == MESSAGE
+
+
+def test_raw_path_indexes():
+    decoded = pycbor.decode(MESSAGE, raw_paths=[('items', 1),
+                                                 ('payload', 'x', 2, 'y')])
+    assert decoded['items'][0] == {'body': [1]}
+    assert decoded['items'][1] == pycbor.Raw(pycbor.encode({'body': 'text'}))
+    assert decoded['payload']['x'][2]['y'] == pycbor.Raw(b'\x41z')
+    assert pycbor.encode(decoded) == MESSAGE
+
+
+def test_overlapping_raw_paths():
+    encoded = pycbor.encode({'a': {'x': 1, 'y': [2], 'z': 3},
+                             'b': {'x': 4, 'y': [5]}})
+    decoded = pycbor.decode(encoded, raw_paths=[('a', 'x'), (..., 'y')])
+    assert decoded['a']['x'] == pycbor.Raw(b'\x01')
+    assert decoded['a']['y'] == pycbor.Raw(pycbor.encode([2]))
+    assert decoded['a']['z'] == 3
+    assert decoded['b'] == {'x': 4, 'y': pycbor.Raw(pycbor.encode([5]))}
+
+    # A whole value kept raw covers any longer path into it
+    decoded = pycbor.decode(encoded, raw_paths=[('a', 'y', 0), (..., 'y')])
+    assert decoded['a']['y'] == pycbor.Raw(pycbor.encode([2]))
+    decoded = pycbor.decode(encoded, raw_paths=[('a',), (..., 'y')])
+    assert decoded['a'] == pycbor.Raw(pycbor.encode(
+        {'x': 1, 'y': [2], 'z': 3}))
+    assert decoded['b']['y'] == pycbor.Raw(pycbor.encode([5]))
+
+
+def test_indefinite_containers():
+    encoded = b'\xbf\x61a\x9f\x01\x5f\x41x\xff\xff\x61b\x02\xff'
+    decoded = pycbor.decode(encoded, raw_paths=[('a',)])
+    assert decoded == {'a': pycbor.Raw(b'\x9f\x01\x5f\x41x\xff\xff'), 'b': 2}
+    decoded = pycbor.decode(b'\x9f\x01\x02\xff', raw_paths=[(1,)])
+    assert decoded == [1, pycbor.Raw(b'\x02')]
+
+
+def test_references_are_decoded():
+    data = {'a': 'abcd', 'b': ['abcd']}
+    encoded = pycbor.encode(data, string_referencing=True)
+    assert pycbor.decode(encoded, raw_paths=[('b',)]) == data
+
+    shared = [1]
+    encoded = pycbor.encode({'a': shared, 'b': shared}, value_sharing=True)
+    decoded = pycbor.decode(encoded, raw_paths=[('b',)])
+    assert decoded['a'] is decoded['b']
+
+
+def test_empty_path():
+    with pytest.raises(ValueError):
+        pycbor.Decoder(raw_paths=[()])
+
+
+def test_embedded():
+    encoded = pycbor.encode(pycbor.Tag(24, pycbor.encode([1, {'a': 2}])))
+    decoded = pycbor.decode(memoryview(encoded))
+    assert decoded.tag == 24 and isinstance(decoded.value, memoryview)
+    assert pycbor.encode(decoded) == encoded
+    assert pycbor.decode(encoded, decode_embedded=True) == [1, {'a': 2}]
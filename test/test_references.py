@@ -0,0 +1,128 @@
+import array
+import dataclasses
+
+import pytest
+
+import pycbor
+
+
+def test_string_references():
+    data = ['aaa', 'aaa', b'aaa', b'aaa', 'bb', 'bb']
+    encoded = pycbor.encode(data, string_referencing=True)
+    assert encoded == (b'\xd9\x01\x00\x86\x63aaa\xd8\x19\x00\x43aaa'
+                       b'\xd8\x19\x01\x62bb\x62bb')
+    assert pycbor.decode(encoded) == data
+
+
+def test_string_reference_map_keys():
+    data = [{'identifier': i, 'value': str(i) * 3} for i in range(100)]
+    encoded = pycbor.encode(data, string_referencing=True)
+    assert len(encoded) < len(pycbor.encode(data)) * 2 // 3
+    assert pycbor.decode(encoded) == data
+    assert pycbor.decode(memoryview(encoded)) == data
+
+
+def test_string_reference_namespaces():
+    # A nested namespace starts empty and hides the outer one
+    encoded = b'\xd9\x01\x00\x83\x63aaa\xd9\x01\x00\x82\x63bbb\xd8\x19\x00' \
+              b'\xd8\x19\x00'
+    assert pycbor.decode(encoded) == ['aaa', ['bbb', 'bbb'], 'aaa']
+
+
+def test_string_reference_without_namespace():
+    with pytest.raises(ValueError):
+        pycbor.decode(b'\xd8\x19\x00')
+
+
+def test_undefined_string_reference():
+    with pytest.raises(ValueError):
+        pycbor.decode(b'\xd9\x01\x00\x82\x63abc\xd8\x19\x01')
+
+
+def test_string_referencing_bytearray():
+    data = [bytearray(b'aaa'), bytearray(b'aaa')]
+    assert pycbor.decode(pycbor.encode(data, string_referencing=True)) == \
+        data
+
+
+def test_string_referencing_other_byte_strings():
+    for value in (bytearray(b'aaa'), memoryview(b'aaa'),
+                  array.array('i', [1]), 1 << 70):
+        data = [value, b'bbb', b'bbb', b'aaa']
+        decoded = pycbor.decode(pycbor.encode(data, string_referencing=True))
+        assert decoded[1:] == [b'bbb', b'bbb', b'aaa']
+
+
+@dataclasses.dataclass
+class Record:
+    xxx: int
+    yyy: int
+
+
+def test_string_referencing_records():
+    data = [Record(1, 2), 'zzzz', 'zzzz', 'xxx', {'yyy': 3}]
+    decoded = pycbor.decode(pycbor.encode(data, string_referencing=True))
+    assert decoded == [{'xxx': 1, 'yyy': 2}, 'zzzz', 'zzzz', 'xxx',
+                       {'yyy': 3}]
+
+    schema = pycbor.Schema(['xxx', 'yyy'])
+    encoded = schema.encode({'xxx': 'xxx', 'yyy': 'yyy'},
+                            string_referencing=True)
+    assert pycbor.decode(encoded) == {'xxx': 'xxx', 'yyy': 'yyy'}
+
+
+def test_string_referencing_raw():
+    data = [pycbor.Raw(pycbor.encode(['qqqq', 'qqqq'])), 'zzzz', 'zzzz']
+    decoded = pycbor.decode(pycbor.encode(data, string_referencing=True))
+    assert decoded == [['qqqq', 'qqqq'], 'zzzz', 'zzzz']
+
+
+def test_value_sharing():
+    shared = {'a': 1}
+    data = [shared, shared, [shared]]
+    encoded = pycbor.encode(data, value_sharing=True)
+    assert encoded == b'\x83\xd8\x1c\xa1\x61a\x01\xd8\x1d\x00\x81\xd8\x1d\x00'
+
+    decoded = pycbor.decode(encoded)
+    assert decoded == data
+    assert decoded[0] is decoded[1] is decoded[2][0]
+
+
+def test_value_sharing_only_tags_repeated_values():
+    data = [[1], [1]]
+    assert pycbor.encode(data, value_sharing=True) == pycbor.encode(data)
+
+
+def test_value_sharing_cycle():
+    data = [1]
+    data.append(data)
+    encoded = pycbor.encode(data, value_sharing=True)
+    assert encoded == b'\xd8\x1c\x82\x01\xd8\x1d\x00'
+
+    decoded = pycbor.decode(encoded)
+    assert decoded[0] == 1
+    assert decoded[1] is decoded
+
+
+def test_value_sharing_scalar():
+    decoded = pycbor.decode(b'\x82\xd8\x1c\x63abc\xd8\x1d\x00')
+    assert decoded == ['abc', 'abc']
+
+
+def test_shared_reference_unavailable():
+    with pytest.raises(ValueError):
+        pycbor.decode(b'\x81\xd8\x1d\x00')
+
+
+def test_value_sharing_object_pairs_hook():
+    shared = {'a': [1]}
+    decoded = pycbor.decode(pycbor.encode([shared, shared], value_sharing=True),
+                            object_pairs_hook=list)
+    assert decoded == [[('a', [1])], [('a', [1])]]
+    assert decoded[0] is decoded[1]
+
+    # A hook's result only exists once all its pairs are decoded, so a
+    # reference from inside must not pick up a nested container instead
+    encoded = b'\xd8\x1c\xa2\x61x\x81\x01\x61y\xd8\x1d\x00'
+    with pytest.raises(ValueError):
+        pycbor.decode(encoded, object_pairs_hook=list)
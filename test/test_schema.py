@@ -0,0 +1,85 @@
+import collections
+import dataclasses
+
+import pytest
+
+import pycbor
+
+
+def test_encode_matches_generic():
+    schema = pycbor.Schema({'id': int, 'name': str})
+    record = {'id': 1, 'name': 'a'}
+    assert schema.encode(record) == pycbor.encode(record)
+    records = [{'id': i, 'name': str(i)} for i in range(3)]
+    assert schema.encode_many(records) == pycbor.encode(records)
+
+
+def test_decode():
+    schema = pycbor.Schema(['id', 'name'])
+    records = [{'id': i, 'name': str(i)} for i in range(30)]
+    assert schema.decode(pycbor.encode(records[0])) == records[0]
+    assert schema.decode_many(pycbor.encode(records)) == records
+
+
+def test_decode_other_layouts():
+    schema = pycbor.Schema(['id', 'name'])
+    assert schema.decode(pycbor.encode({'name': 'a', 'id': 1, 'x': 2})) == \
+        {'id': 1, 'name': 'a'}
+    with pytest.raises(ValueError):
+        schema.decode(pycbor.encode({'id': 1}))
+    with pytest.raises(ValueError):
+        schema.decode(pycbor.encode([1, 'a']))
+
+
+def test_field_types():
+    schema = pycbor.Schema({'id': int, 'name': str})
+    with pytest.raises(ValueError):
+        schema.decode(pycbor.encode({'id': 'x', 'name': 'a'}))
+
+
+def test_decode_from():
+    schema = pycbor.Schema(['id'])
+    encoded = b'\x00' + pycbor.encode({'id': 5})
+    assert schema.decode_from(encoded, 1) == ({'id': 5}, len(encoded))
+
+
+@dataclasses.dataclass
+class Point:
+    x: int
+    y: int
+
+
+Pair = collections.namedtuple('Pair', 'left right')
+
+
+class Slotted:
+    __slots__ = ('a', 'b')
+
+    def __init__(self, a, b):
+        self.a = a
+        self.b = b
+
+
+def test_classes():
+    schema = pycbor.Schema.for_class(Point)
+    encoded = schema.encode(Point(1, 2))
+    assert encoded == pycbor.encode({'x': 1, 'y': 2})
+    assert schema.decode(encoded) == Point(1, 2)
+
+    schema = pycbor.Schema.for_class(Pair)
+    assert schema.decode(schema.encode(Pair(1, 2))) == Pair(1, 2)
+    assert schema.decode(pycbor.encode(Pair(1, 2))) == Pair(1, 2)
+    with pytest.raises(ValueError):
+        schema.decode(pycbor.encode([1]))
+    with pytest.raises(ValueError):
+        pycbor.Schema.for_class(Point).decode(pycbor.encode([1, 2]))
+
+    schema = pycbor.Schema.for_class(Slotted)
+    decoded = schema.decode(schema.encode(Slotted(1, 'b')))
+    assert (decoded.a, decoded.b) == (1, 'b')
+
+
+def test_explicit_class():
+    schema = pycbor.Schema({'x': int, 'y': int}, Point)
+    assert schema.decode_many(schema.encode_many([Point(1, 2)])) == \
+        [Point(1, 2)]
@@ -0,0 +1,115 @@
+import multiprocessing
+import queue
+
+import pytest
+
+import pycbor
+from pycbor.shm import RingBuffer
+
+
+@pytest.fixture
+def ring():
+    producer = RingBuffer(size=128)
+    consumer = RingBuffer(producer.name)
+    yield producer, consumer
+    consumer.close()
+    producer.close()
+    producer.unlink()
+
+
+def test_round_trip(ring):
+    producer, consumer = ring
+    producer.put([1, 'a', {'b': 2}])
+    producer.put(None)
+    assert consumer.get() == [1, 'a', {'b': 2}]
+    assert consumer.get() is None
+
+
+def test_zero_copy_bytes(ring):
+    producer, consumer = ring
+    producer.put(b'abc')
+    value = consumer.get()
+    assert isinstance(value, memoryview)
+    assert value == b'abc'
+    value.release()
+    consumer.release()
+
+
+def test_close_with_views():
+    producer = RingBuffer(size=128)
+    with RingBuffer(producer.name) as consumer:
+        producer.put(b'abc')
+        value = consumer.get()
+    assert value == b'abc'
+    value.release()
+    producer.close()
+    producer.unlink()
+
+
+def test_wrap_around(ring):
+    producer, consumer = ring
+    for i in range(20):
+        producer.put(bytes(range(i)) + b'x' * 20, timeout=0)
+        assert bytes(consumer.get(timeout=0)) == bytes(range(i)) + b'x' * 20
+        consumer.release()
+
+
+def test_put_encodes_in_place(ring):
+    producer, consumer = ring
+    for i in range(10):
+        producer.put([i, b'x' * 40], timeout=0)
+        number, data = consumer.get(timeout=0)
+        assert (number, data) == (i, b'x' * 40)
+        data.release()
+    # Messages went straight into the shared memory and never through the
+    # encoder's own buffer
+    assert len(producer._encoder._buffer) == 0
+
+
+def test_full_and_empty(ring):
+    producer, consumer = ring
+    with pytest.raises(queue.Empty):
+        consumer.get(block=False)
+    producer.put(b'x' * 50)
+    producer.put(b'x' * 50)
+    with pytest.raises(queue.Full):
+        producer.put(b'x' * 50, timeout=0.01)
+
+
+def test_bad_message_is_released(ring):
+    producer, consumer = ring
+    producer.put(pycbor.Raw(b'\x82\x01\xd8\x1d\x05'))
+    producer.put([1, 2])
+    with pytest.raises(ValueError):
+        consumer.get(timeout=0)
+    assert consumer.get(timeout=0) == [1, 2]
+
+
+def test_too_large(ring):
+    producer, _ = ring
+    with pytest.raises(ValueError):
+        producer.put(b'x' * 100)
+
+
+def produce(name, count):
+    with RingBuffer(name) as producer:
+        for i in range(count):
+            producer.put([i, b'x' * (i % 30)], timeout=10)
+
+
+def test_other_process(ring):
+    producer, consumer = ring
+    # 200 messages only fit in 128 bytes if the consumer in this process
+    # releases space that the producer in the other process then reuses
+    process = multiprocessing.Process(target=produce,
+                                      args=(producer.name, 200))
+    process.start()
+    for i in range(200):
+        number, data = consumer.get(timeout=10)
+        assert number == i
+        assert data == b'x' * (i % 30)
+        data.release()
+    process.join(10)
+    assert process.exitcode == 0
+    with pytest.raises(queue.Empty):
+        consumer.get(block=False)
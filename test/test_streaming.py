@@ -0,0 +1,37 @@
+import hashlib
+import io
+
+import pycbor
+
+
+def test_encode_to_chunks():
+    data = [{'key': list(range(100))} for i in range(100)]
+    chunks = []
+    encoder = pycbor.Encoder(chunk_size=256)
+    encoder.encode_to(data, lambda chunk: chunks.append(bytes(chunk)))
+    assert len(chunks) > 1
+    assert b''.join(chunks) == pycbor.encode(data)
+    assert encoder.encode(1) == b'\x01'
+
+
+def test_dump():
+    fp = io.BytesIO()
+    pycbor.dump({'a': [1, 2.5]}, fp)
+    assert fp.getvalue() == pycbor.encode({'a': [1, 2.5]})
+
+
+def test_digest():
+    data = {'b': [1.5] * 1000, 'a': {'c': 'x' * 100}}
+    assert pycbor.digest(data, chunk_size=64) == \
+        hashlib.sha256(pycbor.encode(data)).digest()
+    assert pycbor.digest(data, 'md5') == \
+        hashlib.md5(pycbor.encode(data)).digest()
+
+
+def test_canonical_digest():
+    first = {'b': (1, {'y': 2, 'x': 1}), 'a': 'x' * 1000}
+    second = {'a': 'x' * 1000, 'b': (1, {'x': 1, 'y': 2})}
+    assert pycbor.digest(first, canonical=True, chunk_size=16) == \
+        pycbor.digest(second, canonical=True)
+    assert pycbor.digest(first, canonical=True) == \
+        hashlib.sha256(pycbor.encode(first, canonical=True)).digest()
@@ -0,0 +1,74 @@
+import io
+
+import pytest
+
+import pycbor
+
+
+def test_byte_stream():
+    encoded = pycbor.encode(pycbor.ByteStream(iter([b'ab', b'', b'c'])))
+    assert encoded == b'\x5f\x42ab\x41c\xff'
+    assert pycbor.decode(encoded) == b'abc'
+
+
+def test_text_stream():
+    encoded = pycbor.encode(pycbor.TextStream(['a', 'ü']))
+    assert encoded == b'\x7f\x61a\x62\xc3\xbc\xff'
+    assert pycbor.decode(encoded) == 'aü'
+
+
+def test_file_objects():
+    data = bytes(range(256)) * 10
+    encoded = pycbor.encode({'file': pycbor.ByteStream(io.BytesIO(data), 1000)})
+    assert encoded.count(b'\x59\x03\xe8') == 2
+    assert pycbor.decode(encoded) == {'file': data}
+
+    encoded = pycbor.encode(pycbor.TextStream(io.StringIO('x' * 30), 7))
+    assert pycbor.decode(encoded) == 'x' * 30
+
+
+def test_streamed_output():
+    data = b'x' * 100000
+    chunks = []
+    encoder = pycbor.Encoder(chunk_size=4096)
+    encoder.encode_to(pycbor.ByteStream(io.BytesIO(data), 1000),
+                      lambda chunk: chunks.append(bytes(chunk)))
+    assert len(chunks) > 1
+    assert pycbor.decode(b''.join(chunks)) == data
+
+
+def test_wrong_chunk_types():
+    with pytest.raises(TypeError):
+        pycbor.encode(pycbor.ByteStream(['a']))
+    with pytest.raises(TypeError):
+        pycbor.encode(pycbor.TextStream([b'a']))
+
+
+def test_canonical():
+    assert pycbor.encode(pycbor.TextStream(['a', 'b']), canonical=True) == \
+        b'\x62ab'
+    assert pycbor.encode(pycbor.ByteStream([b'a', b'b']), canonical=True) == \
+        b'\x42ab'
+
+
+def test_decode_chunks():
+    encoded = b'\x5f\x42ab\x40\x41c\xff'
+    assert pycbor.decode(encoded) == b'abc'
+    assert pycbor.decode(memoryview(encoded)) == b'abc'
+    assert pycbor.decode(encoded, chunked_strings=True) == [b'ab', b'', b'c']
+    assert pycbor.decode(b'\x7f\x62\xc3\xbc\x61a\xff') == 'üa'
+    assert pycbor.decode(b'\x7f\x62\xc3\xbc\x61a\xff',
+                         chunked_strings=True) == ['ü', 'a']
+
+
+def test_invalid_chunks():
+    for encoded in (b'\x5f\x61a\xff', b'\x5f\x5f\xff\xff', b'\x7f\x41a\xff',
+                    b'\x5f\x45ab\xff'):
+        with pytest.raises(ValueError):
+            pycbor.decode(encoded)
+
+
+def test_chunks_are_not_references():
+    # The chunked string does not take the first slot in the namespace
+    encoded = b'\xd9\x01\x00\x83\x7f\x63abc\xff\x63def\xd8\x19\x00'
+    assert pycbor.decode(encoded) == ['abc', 'def', 'def']
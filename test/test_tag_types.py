@@ -0,0 +1,56 @@
+import datetime
+import decimal
+import fractions
+import ipaddress
+import uuid
+
+import pytest
+
+import pycbor
+
+UTC = datetime.timezone.utc
+
+
+@pytest.mark.parametrize('value, encoded', [
+    (datetime.datetime(2013, 3, 21, 20, 4, 0, tzinfo=UTC),
+     b'\xc1\x1a\x51\x4b\x67\xb0'),
+    (datetime.datetime(2013, 3, 21, 20, 4, 0, 500000, tzinfo=UTC),
+     b'\xc1\xfb\x41\xd4\x52\xd9\xec\x20\x00\x00'),
+    (decimal.Decimal('273.15'), b'\xc4\x82\x21\x19\x6a\xb3'),
+    (decimal.Decimal('-1.5'), b'\xc4\x82\x20\x2e'),
+    (fractions.Fraction(1, 3), b'\xd8\x1e\x82\x01\x03'),
+    (uuid.UUID('8b1a9953-c461-1296-a827-abf8c47804d7'),
+     b'\xd8\x25\x50\x8b\x1a\x99\x53\xc4\x61\x12\x96\xa8\x27\xab\xf8\xc4\x78'
+     b'\x04\xd7'),
+    (ipaddress.ip_address('192.0.2.1'), b'\xd8\x34\x44\xc0\x00\x02\x01'),
+    (ipaddress.ip_network('192.0.2.0/24'),
+     b'\xd8\x34\x82\x18\x18\x43\xc0\x00\x02'),
+    (ipaddress.ip_interface('192.0.2.1/24'),
+     b'\xd8\x34\x82\x44\xc0\x00\x02\x01\x18\x18'),
+    (ipaddress.ip_address('2001:db8::1'),
+     b'\xd8\x36\x50\x20\x01\x0d\xb8' + bytes(11) + b'\x01'),
+    (ipaddress.ip_network('2001:db8::/32'),
+     b'\xd8\x36\x82\x18\x20\x44\x20\x01\x0d\xb8'),
+])
+def test_round_trip(value, encoded):
+    assert pycbor.encode(value) == encoded
+    assert pycbor.decode(encoded) == value
+
+
+def test_decode_datetime_string():
+    assert pycbor.decode(b'\xc0\x74' b'2013-03-21T20:04:00Z') == \
+        datetime.datetime(2013, 3, 21, 20, 4, 0, tzinfo=UTC)
+
+
+def test_naive_datetime():
+    with pytest.raises(ValueError):
+        pycbor.encode(datetime.datetime(2013, 3, 21))
+
+
+def test_special_decimals():
+    assert pycbor.encode(decimal.Decimal('Infinity')) == b'\xf9\x7c\x00'
+
+
+def test_large_decimal_is_exact():
+    value = decimal.Decimal('3.14159265358979323846264338327950288419716939')
+    assert pycbor.decode(pycbor.encode(value)) == value
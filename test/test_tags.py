@@ -0,0 +1,48 @@
+import collections
+import enum
+
+import pytest
+
+import pycbor
+
+
+class Point:
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+def test_unknown_tag_round_trip():
+    encoded = b'\xd9\x03\xe8\x82\x01\x02'
+    decoded = pycbor.decode(encoded)
+    assert decoded == pycbor.Tag(1000, [1, 2])
+    assert pycbor.encode(decoded) == encoded
+
+
+def test_tag_repr():
+    assert repr(pycbor.Tag(1000, 'a')) == "Tag(1000, 'a')"
+
+
+def test_custom_encoder_and_tag_decoder():
+    encoders = {Point: lambda encoder, p: pycbor.Tag(5000, [p.x, p.y])}
+    tag_decoders = {5000: lambda decoder, value: Point(*value)}
+
+    encoded = pycbor.encode([Point(1, 2)], encoders=encoders)
+    assert encoded == b'\x81\xd9\x13\x88\x82\x01\x02'
+
+    point, = pycbor.decode(encoded, tag_decoders=tag_decoders)
+    assert (point.x, point.y) == (1, 2)
+    assert pycbor.decode(encoded) == [pycbor.Tag(5000, [1, 2])]
+
+
+def test_subclasses_use_base_encoding():
+    class Color(enum.IntEnum):
+        RED = 1
+
+    data = collections.OrderedDict([('a', Color.RED)])
+    assert pycbor.encode(data) == pycbor.encode({'a': 1})
+
+
+def test_unsupported_type():
+    with pytest.raises(TypeError):
+        pycbor.encode([Point(1, 2)])
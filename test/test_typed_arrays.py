@@ -0,0 +1,87 @@
+import array
+import sys
+
+import pytest
+
+import pycbor
+
+
+def test_encode_array():
+    data = array.array('H', [1, 2])
+    tag = 0x45 if sys.byteorder == 'little' else 0x41
+    assert pycbor.encode(data) == bytes([0xd8, tag, 0x44]) + data.tobytes()
+
+
+def test_encode_uint8_array():
+    assert pycbor.encode(array.array('B', [1, 2])) == b'\xd8\x40\x42\x01\x02'
+
+
+@pytest.mark.parametrize('typecode', 'bBhHiIlLqQfd')
+def test_array_round_trip(typecode):
+    data = array.array(typecode, [0, 1, 2, 100])
+    assert pycbor.decode(pycbor.encode(data)) == data
+
+
+def test_decode_big_endian():
+    # uint16 big endian [1, 2]
+    decoded = pycbor.decode(b'\xd8\x41\x44\x00\x01\x00\x02')
+    assert decoded.itemsize == 2
+    assert decoded.tolist() == [1, 2]
+
+
+def test_decode_float16():
+    # float16 little endian [1.0, -2.0]
+    decoded = pycbor.decode(b'\xd8\x54\x44\x00\x3c\x00\xc0')
+    assert decoded == array.array('f', [1.0, -2.0])
+
+
+def test_decode_bad_length():
+    with pytest.raises(ValueError):
+        pycbor.decode(b'\xd8\x41\x43\x00\x01\x00')
+
+
+def test_numpy_round_trip():
+    numpy = pytest.importorskip('numpy')
+    for dtype in ('<u2', '>i4', '<f2', '>f4', 'f8', 'u1'):
+        data = numpy.arange(10, dtype=dtype)
+        decoded = pycbor.decode(pycbor.encode(data), numpy=True)
+        assert decoded.dtype == data.dtype
+        assert (decoded == data).all()
+
+
+def test_numpy_zero_copy():
+    numpy = pytest.importorskip('numpy')
+    encoded = memoryview(pycbor.encode(numpy.arange(4, dtype='f8')))
+    decoded = pycbor.decode(encoded, numpy=True)
+    assert decoded.base is not None
+    assert decoded.tolist() == [0.0, 1.0, 2.0, 3.0]
+
+
+def test_decode_multi_dim_row_major():
+    # [[1, 2, 3], [4, 5, 6]] as uint8
+    encoded = b'\xd8\x28\x82\x82\x02\x03\xd8\x40\x46\x01\x02\x03\x04\x05\x06'
+    assert pycbor.decode(encoded) == [[1, 2, 3], [4, 5, 6]]
+
+
+def test_decode_multi_dim_column_major():
+    encoded = b'\xd9\x04\x10\x82\x82\x02\x03\x86\x01\x04\x02\x05\x03\x06'
+    assert pycbor.decode(encoded) == [[1, 2, 3], [4, 5, 6]]
+
+
+def test_decode_multi_dim_bad_shape():
+    with pytest.raises(ValueError):
+        pycbor.decode(b'\xd8\x28\x82\x82\x02\x03\x83\x01\x02\x03')
+
+
+def test_numpy_multi_dim_round_trip():
+    numpy = pytest.importorskip('numpy')
+    data = numpy.arange(24, dtype='<f4').reshape(2, 3, 4)
+    for value in (data, numpy.asfortranarray(data), data[:, ::2]):
+        encoded = pycbor.encode(value)
+        decoded = pycbor.decode(encoded, numpy=True)
+        assert decoded.shape == value.shape
+        assert decoded.dtype == value.dtype
+        assert (decoded == value).all()
+        assert pycbor.decode(encoded) == value.tolist()
+
+    assert pycbor.encode(numpy.asfortranarray(data))[:3] == b'\xd9\x04\x10'